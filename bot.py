@@ -2,7 +2,11 @@ import asyncio
 import logging
 from aiogram import Bot, Dispatcher
 from handlers import router
-from scheduler import start_scheduler
+from scheduler import start_scheduler, stop_scheduler, flush_last_alerts
+from database import init_db, close_db
+from services.delivery import delivery_queue
+from services.coingecko import coingecko
+from webhook import run_webhook, require_webhook_secret
 from config.config import config
 
 from typing import Optional
@@ -16,16 +20,46 @@ async def main() -> None:
     Основная функция запуска бота
     
     Инициализирует бота, диспетчер, подключает роутеры и запускает планировщик задач.
-    Затем начинает polling для получения обновлений от Telegram.
+    Затем начинает получать обновления от Telegram: через polling (по умолчанию)
+    или через webhook, если BOT_MODE=webhook.
+    BOT_ROLE позволяет запустить только обработку обновлений (bot)
+    или только планировщик и очередь доставки (scheduler).
+    При остановке дожидается отправки сообщений из очереди доставки,
+    закрывает HTTP-сессию CoinGecko и соединения с базой данных.
     
     Returns:
         None
     """
+    if config.BOT_MODE == 'webhook' and config.BOT_ROLE != 'scheduler':
+        # проверяется до запуска планировщика, чтобы не стартовать наполовину
+        require_webhook_secret()
     bot = Bot(token=config.BOT_TOKEN)
     dp = Dispatcher()
     dp.include_router(router)
-    await start_scheduler(bot) # запускам планировщик на каждые 60 секунд
-    await dp.start_polling(bot)
+    await coingecko.start()
+    run_scheduler = config.BOT_ROLE in ('all', 'scheduler')
+    try:
+        if run_scheduler:
+            delivery_queue.start(bot)
+            await start_scheduler(bot) # запускам планировщик на каждые 60 секунд
+        else:
+            await init_db()
+        if config.BOT_ROLE == 'scheduler':
+            await asyncio.Event().wait()
+        elif config.BOT_MODE == 'webhook':
+            await run_webhook(dp, bot)
+        else:
+            # start_polling не снимает webhook, оставшийся от запуска с BOT_MODE=webhook,
+            # и getUpdates при нём завершается конфликтом
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        if run_scheduler:
+            await stop_scheduler()
+            await delivery_queue.stop()
+            await flush_last_alerts()
+        await coingecko.close()
+        await close_db()
 
 if __name__ == "__main__":
     """
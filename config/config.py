@@ -8,5 +8,27 @@ class Config:
     BOT_TOKEN: str = os.getenv('TELEGRAM_API_KEY')
     LOG_LEVEL: str = os.getenv('LOG_LEVEL')
     TIME_ZONE: int = int(os.getenv('TIME_ZONE'))
+    CBR_TIMEOUT: float = float(os.getenv('CBR_TIMEOUT', 30))
+    CBR_CURRENCIES: list = os.getenv('CBR_CURRENCIES', 'USD,EUR').split(',')
+    # режим получения обновлений: polling или webhook
+    BOT_MODE: str = os.getenv('BOT_MODE', 'polling')
+    WEBHOOK_URL: str = os.getenv('WEBHOOK_URL', '')
+    WEBHOOK_PATH: str = os.getenv('WEBHOOK_PATH', '/webhook')
+    # обязателен в режиме webhook: без него бот не запускается
+    WEBHOOK_SECRET: str = os.getenv('WEBHOOK_SECRET', '')
+    WEBHOOK_CONCURRENCY: int = int(os.getenv('WEBHOOK_CONCURRENCY', 40))
+    WEBAPP_HOST: str = os.getenv('WEBAPP_HOST', '0.0.0.0')
+    WEBAPP_PORT: int = int(os.getenv('WEBAPP_PORT', 8080))
+    # роль процесса: all — всё в одном процессе, bot — только обработка
+    # обновлений, scheduler — только фоновые задачи и рассылка уведомлений
+    BOT_ROLE: str = os.getenv('BOT_ROLE', 'all')
+    # сжатый снимок справочника криптовалют для быстрого первого запуска
+    COINS_LIST_SNAPSHOT: str = os.getenv('COINS_LIST_SNAPSHOT', 'coins_list.json.gz')
+    # хранение истории цен: rows — строка на выборку, columnar — завершённые
+    # дни упаковываются в блоки (см. services/price_blocks.py)
+    PRICE_STORAGE: str = os.getenv('PRICE_STORAGE', 'rows')
+    PRICE_RETENTION_DAYS: int = int(os.getenv('PRICE_RETENTION_DAYS', 3))
+    # каталог снимка истории цен за сутки для быстрого старта, пусто — отключён
+    PRICE_SNAPSHOT_DIR: str = os.getenv('PRICE_SNAPSHOT_DIR', 'price_snapshot')
 
 config = Config()
\ No newline at end of file
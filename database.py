@@ -1,34 +1,319 @@
+import asyncio
+import gzip
+import os
+import math
+import shutil
 import aiosqlite
-from services.coingecko import fetch_coins_list
+from contextlib import asynccontextmanager
+from migrations import migrate, ROLLUP_TABLES, price_partition, get_price_partitions, create_price_partition, rebuild_prices_view
+from services.coingecko import download_coins_list
+from services.json_stream import iter_json_array
+from services.price_blocks import encode_blocks, decode_block
+from services.subscription_index import subscription_index
+from config.config import config
 import logging
 import time
-from typing import List, Tuple, Dict, Any, Optional, Union
+from itertools import islice, repeat
+from operator import itemgetter
+from typing import List, Tuple, Dict, Any, Optional, Union, AsyncIterator, Iterable, BinaryIO, NamedTuple
 
 DB_FILE = "db.sqlite"
+# размер пачки строк при синхронизации справочника криптовалют
+COINS_LIST_BATCH = 1000
+COINS_LIST_HASH_KEY = 'coins_list_hash'
+# пауза между попытками загрузить справочник при первом запуске
+COINS_LIST_RETRY = 60
+# сроки хранения сырых цен и агрегатов каждого уровня, секунды
+RAW_PRICES_RETENTION = config.PRICE_RETENTION_DAYS * 86400
+ROLLUP_RETENTION: Dict[str, int] = {
+    'prices_5m': 14 * 86400,
+    'prices_1h': 180 * 86400,
+    'prices_1d': 5 * 365 * 86400,
+}
+# сколько интервалов агрегата допустимо читать для одной статистики
+ROLLUP_MAX_BUCKETS = 400
+# сколько тикеров подставлять в один запрос
+TICKERS_BATCH = 500
+# сколько свободных страниц возвращать системе за один шаг incremental_vacuum
+VACUUM_STEP = 256
+
+
+class PriceStats(NamedTuple):
+    """
+    Статистика цены за период
+
+    volatility — реализованная волатильность за период: корень из суммы
+    квадратов относительных изменений между соседними выборками, в процентах.
+    """
+    open: float
+    high: float
+    low: float
+    close: float
+    since: int
+    volatility: float
+
+
 logger = logging.getLogger(__name__)
 
+
+class ConnectionPool:
+    """
+    Пул долгоживущих соединений с SQLite
+
+    Держит одно соединение для записи (доступ к нему сериализуется блокировкой)
+    и несколько соединений только для чтения. База переводится в режим WAL,
+    поэтому читатели не блокируются писателем.
+    """
+
+    PRAGMAS = (
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA busy_timeout = 5000",
+        "PRAGMA cache_size = -8000",
+        "PRAGMA temp_store = MEMORY",
+        "PRAGMA mmap_size = 67108864",
+    )
+
+    def __init__(self, db_file: str, readers: int = 3) -> None:
+        self.db_file: str = db_file
+        self.readers_count: int = readers
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._readers: List[aiosqlite.Connection] = []
+        self._idle_readers: asyncio.Queue = asyncio.Queue()
+        self._write_lock = asyncio.Lock()
+        self._open_lock = asyncio.Lock()
+
+    async def _connect(self, readonly: bool) -> aiosqlite.Connection:
+        """
+        Открывает соединение и применяет к нему настройки
+
+        Args:
+            readonly: Открыть соединение только для чтения
+
+        Returns:
+            Открытое соединение
+        """
+        conn = await aiosqlite.connect(self.db_file)
+        # auto_vacuum действует сразу только для новой базы, для существующей
+        # режим включается однократным VACUUM в enable_incremental_vacuum()
+        writer_pragmas = ("PRAGMA auto_vacuum = INCREMENTAL", "PRAGMA journal_mode = WAL")
+        pragmas = self.PRAGMAS + (("PRAGMA query_only = ON",) if readonly else writer_pragmas)
+        for pragma in pragmas:
+            cursor = await conn.execute(pragma)
+            await cursor.close()
+        return conn
+
+    async def open(self) -> None:
+        """
+        Открывает соединения пула, если они ещё не открыты
+
+        Returns:
+            None
+        """
+        async with self._open_lock:
+            if self._writer is not None:
+                return
+            writer = await self._connect(readonly=False)
+            for _ in range(self.readers_count):
+                reader = await self._connect(readonly=True)
+                self._readers.append(reader)
+                self._idle_readers.put_nowait(reader)
+            self._writer = writer
+            logger.debug(f'DB pool opened: 1 writer, {self.readers_count} readers')
+
+    async def close(self) -> None:
+        """
+        Закрывает все соединения пула
+
+        Returns:
+            None
+        """
+        async with self._open_lock:
+            if self._writer is None:
+                return
+            async with self._write_lock:
+                await self._writer.close()
+                self._writer = None
+            for reader in self._readers:
+                await reader.close()
+            self._readers.clear()
+            self._idle_readers = asyncio.Queue()
+            logger.debug(f'DB pool closed')
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """
+        Выдаёт соединение для записи, монопольно на время блока
+
+        Незавершённая транзакция откатывается, если блок упал с ошибкой
+        или задача была отменена посреди транзакции, чтобы её половину
+        не закоммитил следующий владелец соединения.
+        """
+        await self.open()
+        async with self._write_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                # CancelledError — не Exception; shield не даёт повторной
+                # отмене прервать сам откат
+                await asyncio.shield(self._writer.rollback())
+                raise
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """
+        Выдаёт свободное соединение для чтения и возвращает его в пул после блока
+        """
+        await self.open()
+        conn = await self._idle_readers.get()
+        try:
+            yield conn
+        finally:
+            self._idle_readers.put_nowait(conn)
+
+
+db_pool = ConnectionPool(DB_FILE)
+# дни, для которых уже есть таблицы сырых цен
+PRICE_PARTITIONS: set = set()
+# установлено, когда справочник криптовалют заполнен
+coins_list_ready = asyncio.Event()
+COINS_LIST_TASK: Optional[asyncio.Task] = None
+
 async def init_db() -> None:
     """
-    Инициализирует базу данных, создает необходимые таблицы
-    и загружает список криптовалют если база пуста
+    Инициализирует базу данных, применяет миграции схемы
+    и, если справочник криптовалют пуст, запускает его загрузку в фоне
+    
+    Запуск бота не ждёт загрузки справочника; обработчики, которым он
+    нужен, ждут его через wait_coins_list_ready().
     
     Returns:
         None
     """
+    global COINS_LIST_TASK
     logger.debug(f'Init DB')
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute("""CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, is_cbrf_subscribed BOOLEAN DEFAULT FALSE)""")
-        await db.execute("""CREATE TABLE IF NOT EXISTS subscriptions (user_id INTEGER, ticker TEXT, last_alert INTEGER, alert_threshold INTEGER, interval INTEGER)""")
-        await db.execute("""CREATE TABLE IF NOT EXISTS prices (ticker TEXT, price REAL, timestamp INTEGER)""")
-        await db.execute("""CREATE TABLE IF NOT EXISTS coins (id INTEGER PRIMARY KEY, ticker TEXT)""")
-        await db.execute("""CREATE TABLE IF NOT EXISTS coins_list (id INTEGER PRIMARY KEY, ticker TEXT, symbol TEXT, name TEXT)""")
-        local_coins_list = await get_coins_from_list()
-        if not local_coins_list:
-            api_coins_list = await fetch_coins_list()
-            logger.debug(f'Local coins list is empty')
-            logger.debug(f'Type of api list: {type(api_coins_list)}')
-            await add_coins_to_list(api_coins_list)
-        await db.commit()
+    await db_pool.open()
+    async with db_pool.writer() as db:
+        version = await migrate(db)
+        logger.debug(f'DB schema version: {version}')
+        await enable_incremental_vacuum(db)
+        PRICE_PARTITIONS.update(await get_price_partitions(db))
+    if not await is_coins_list_empty():
+        coins_list_ready.set()
+    elif COINS_LIST_TASK is None:
+        logger.debug(f'Local coins list is empty')
+        COINS_LIST_TASK = asyncio.create_task(bootstrap_coins_list())
+
+async def enable_incremental_vacuum(db: aiosqlite.Connection) -> None:
+    """
+    Включает режим auto_vacuum = INCREMENTAL для базы, созданной без него
+
+    Для смены режима нужен полный VACUUM, он выполняется один раз.
+
+    Args:
+        db: Соединение с базой данных для записи
+
+    Returns:
+        None
+    """
+    cursor = await db.execute("PRAGMA auto_vacuum")
+    mode = (await cursor.fetchone())[0]
+    if mode == 2:
+        return
+    logger.info(f'Switching DB to incremental auto_vacuum, running VACUUM once')
+    await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    await db.execute("VACUUM")
+
+async def vacuum_db(step: int = VACUUM_STEP) -> int:
+    """
+    Возвращает системе свободные страницы базы небольшими шагами
+
+    Между шагами соединение для записи освобождается, поэтому запись
+    цен не ждёт окончания очистки.
+
+    Args:
+        step: Число страниц за один шаг
+
+    Returns:
+        Число освобождённых страниц
+    """
+    freed = 0
+    while True:
+        async with db_pool.writer() as db:
+            cursor = await db.execute("PRAGMA freelist_count")
+            free = (await cursor.fetchone())[0]
+            if not free:
+                break
+            # execute() делает один шаг прагмы и освобождает одну страницу,
+            # executescript() выполняет её до конца
+            await db.executescript(f"PRAGMA incremental_vacuum({min(step, free)})")
+            cursor = await db.execute("PRAGMA freelist_count")
+            left = (await cursor.fetchone())[0]
+            if left >= free:
+                break
+            freed += free - left
+        await asyncio.sleep(0)
+    if freed:
+        logger.debug(f'Incremental vacuum freed {freed} pages')
+    return freed
+
+async def close_db() -> None:
+    """
+    Закрывает соединения с базой данных при остановке бота
+
+    Returns:
+        None
+    """
+    global COINS_LIST_TASK
+    if COINS_LIST_TASK is not None:
+        COINS_LIST_TASK.cancel()
+        COINS_LIST_TASK = None
+    await db_pool.close()
+
+async def bootstrap_coins_list() -> None:
+    """
+    Заполняет пустой справочник криптовалют
+
+    Сначала загружает снимок config.COINS_LIST_SNAPSHOT, если он есть,
+    и сразу отмечает справочник готовым; затем синхронизирует его с API
+    CoinGecko, повторяя попытки каждые COINS_LIST_RETRY секунд до успеха.
+
+    Returns:
+        None
+    """
+    if os.path.exists(config.COINS_LIST_SNAPSHOT):
+        try:
+            with gzip.open(config.COINS_LIST_SNAPSHOT, 'rb') as snapshot:
+                upserted, _ = await sync_coins_list(iter_json_array(snapshot))
+            logger.info(f'Coins list seeded from {config.COINS_LIST_SNAPSHOT}: {upserted} coins')
+            coins_list_ready.set()
+        except (OSError, ValueError) as error:
+            logger.warning(f'Failed to load coins list snapshot {config.COINS_LIST_SNAPSHOT}: {error}')
+    while True:
+        try:
+            await update_coins_list(force=True)
+            break
+        except Exception as error:
+            logger.error(f'Failed to load coins list, retrying in {COINS_LIST_RETRY}s: {error}')
+            await asyncio.sleep(COINS_LIST_RETRY)
+    coins_list_ready.set()
+
+async def wait_coins_list_ready(timeout: float = 10) -> bool:
+    """
+    Ждёт, пока справочник криптовалют будет заполнен
+
+    Args:
+        timeout: Максимальное время ожидания в секундах
+
+    Returns:
+        True, если справочник готов
+    """
+    if coins_list_ready.is_set():
+        return True
+    try:
+        await asyncio.wait_for(coins_list_ready.wait(), timeout)
+    except asyncio.TimeoutError:
+        return False
+    return True
 
 async def add_user(user_id: int) -> None:
     """
@@ -40,7 +325,7 @@ async def add_user(user_id: int) -> None:
     Returns:
         None
     """
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with db_pool.writer() as db:
         await db.execute("""
         INSERT OR IGNORE INTO users (user_id)
         VALUES (?)
@@ -65,12 +350,17 @@ async def add_subscription(user_id: int, ticker: str, alert_threshold: int = 5,
         interval = 7200
     elif ticker == 'dogecoin' or ticker == 'ethereum':
         alert_threshold = 2
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute("""
-        INSERT INTO subscriptions (user_id, ticker, last_alert, alert_threshold, interval)
+    now = time.time()
+    async with db_pool.writer() as db:
+        cursor = await db.execute("""
+        INSERT OR IGNORE INTO subscriptions (user_id, ticker, last_alert, alert_threshold, interval)
         VALUES (?, ?, ?, ?, ?)
-        """, (user_id, ticker, time.time(), alert_threshold, interval))
+        """, (user_id, ticker, now, alert_threshold, interval))
+        version = await read_change_version(db, 'subscriptions')
         await db.commit()
+        if cursor.rowcount:
+            subscription_index.add(user_id, ticker, now, alert_threshold, interval)
+        subscription_index.advance(version, cursor.rowcount)
 
 async def get_user_subscriptions(user_id: int) -> List[Tuple[int, str, float, int, int]]:
     """
@@ -83,7 +373,7 @@ async def get_user_subscriptions(user_id: int) -> List[Tuple[int, str, float, in
         Список кортежей с данными подписок:
         [(user_id, ticker, last_alert, alert_threshold, interval), ...]
     """
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with db_pool.reader() as db:
         cursor = await db.execute("""
         SELECT user_id, ticker, last_alert, alert_threshold, interval
         FROM subscriptions
@@ -102,7 +392,7 @@ async def get_user_subscriptions_by_ticker(ticker: str) -> List[Tuple[int, float
         Список кортежей с данными подписок:
         [(user_id, last_alert, alert_threshold, interval), ...]
     """
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with db_pool.reader() as db:
         cursor = await db.execute("""
         SELECT user_id, last_alert, alert_threshold, interval
         FROM subscriptions
@@ -110,6 +400,25 @@ async def get_user_subscriptions_by_ticker(ticker: str) -> List[Tuple[int, float
         """, (ticker, ))
         return await cursor.fetchall()
 
+async def get_subscriptions_by_ticker() -> Dict[str, List[Tuple[int, float, int, int]]]:
+    """
+    Получает все подписки одним запросом, сгруппированные по тикерам
+    
+    Returns:
+        Словарь с подписками:
+        {ticker: [(user_id, last_alert, alert_threshold, interval), ...]}
+    """
+    subscriptions: Dict[str, List[Tuple[int, float, int, int]]] = {}
+    async with db_pool.reader() as db:
+        cursor = await db.execute("""
+        SELECT ticker, user_id, last_alert, alert_threshold, interval
+        FROM subscriptions
+        ORDER BY ticker
+        """)
+        for ticker, user_id, last_alert, alert_threshold, interval in await cursor.fetchall():
+            subscriptions.setdefault(ticker, []).append((user_id, last_alert, alert_threshold, interval))
+    return subscriptions
+
 async def update_last_alert(user_id: int, ticker: str) -> None:
     """
     Обновляет время последнего уведомления для подписки
@@ -121,12 +430,34 @@ async def update_last_alert(user_id: int, ticker: str) -> None:
     Returns:
         None
     """
-    async with aiosqlite.connect(DB_FILE) as db:
+    now = time.time()
+    async with db_pool.writer() as db:
         await db.execute("""
         UPDATE subscriptions
         SET last_alert = (?)
         WHERE user_id = (?) AND ticker = (?)
-        """, (time.time(), user_id, ticker, ))
+        """, (now, user_id, ticker, ))
+        await db.commit()
+    subscription_index.set_last_alert(user_id, ticker, now)
+
+async def update_last_alerts(alerts: List[Tuple[float, int, str]]) -> None:
+    """
+    Обновляет время последнего уведомления для нескольких подписок одной транзакцией
+    
+    Args:
+        alerts: Список кортежей [(last_alert, user_id, ticker), ...]
+        
+    Returns:
+        None
+    """
+    if not alerts:
+        return
+    async with db_pool.writer() as db:
+        await db.executemany("""
+        UPDATE subscriptions
+        SET last_alert = (?)
+        WHERE user_id = (?) AND ticker = (?)
+        """, alerts)
         await db.commit()
 
 async def get_user(user_id: int) -> List[Tuple[int]]:
@@ -139,7 +470,7 @@ async def get_user(user_id: int) -> List[Tuple[int]]:
     Returns:
         Список кортежей с данными пользователя или пустой список
     """
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with db_pool.reader() as db:
         cursor = await db.execute("""
         SELECT user_id
         FROM users
@@ -157,9 +488,9 @@ async def add_coin(ticker: str) -> None:
     Returns:
         None
     """
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with db_pool.writer() as db:
         await db.execute("""
-        INSERT INTO coins (ticker)
+        INSERT OR IGNORE INTO coins (ticker)
         VALUES (?)
         """, (ticker, ))
         await db.commit()
@@ -171,7 +502,7 @@ async def get_coins() -> List[Tuple[str]]:
     Returns:
         Список кортежей с тикерами: [('bitcoin',), ('ethereum',), ...]
     """
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with db_pool.reader() as db:
         cursor = await db.execute("""
         SELECT ticker 
         FROM coins
@@ -188,7 +519,7 @@ async def delete_coins(coin: str) -> None:
     Returns:
         None
     """
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with db_pool.writer() as db:
         cursor = await db.execute("""
         SELECT user_id
         FROM subscriptions
@@ -212,9 +543,9 @@ async def add_coins_to_list(coins: Union[List[Tuple], List[Dict[str, str]]]) ->
     Returns:
         None
     """
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with db_pool.writer() as db:
         await db.executemany("""
-        INSERT INTO coins_list (ticker, symbol, name)
+        INSERT OR IGNORE INTO coins_list (ticker, symbol, name)
         VALUES (:id, :symbol, :name)
         """, coins)
         await db.commit()
@@ -223,14 +554,17 @@ async def get_coins_from_list() -> List[Tuple[str, str, str]]:
     """
     Получает полный список криптовалют из справочника
     
+    Монеты, пропавшие из списка CoinGecko, не возвращаются.
+    
     Returns:
         Список кортежей с данными криптовалют:
         [('bitcoin', 'btc', 'Bitcoin'), ...]
     """
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with db_pool.reader() as db:
         cursor = await db.execute("""
         SELECT ticker, symbol, name
         FROM coins_list
+        WHERE delisted_at IS NULL
         """)
         return await cursor.fetchall()
 
@@ -244,18 +578,171 @@ async def get_coin_from_list(ticker: str) -> List[Tuple[str, str, str]]:
     Returns:
         Список кортежей с данными найденных криптовалют
     """
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with db_pool.reader() as db:
         cursor = await db.execute("""
                             SELECT ticker, symbol, name
                             FROM coins_list
-                            WHERE ticker = (?)
+                            WHERE ticker = (?) AND delisted_at IS NULL
                             """, (ticker, ))
         return await cursor.fetchall()
 
+async def is_coins_list_empty() -> bool:
+    """
+    Проверяет, пуст ли справочник криптовалют
+
+    Returns:
+        True, если в справочнике нет ни одной записи
+    """
+    async with db_pool.reader() as db:
+        cursor = await db.execute("""SELECT 1 FROM coins_list LIMIT 1""")
+        return await cursor.fetchone() is None
+
+async def get_meta(key: str) -> Optional[str]:
+    """
+    Получает служебное значение из таблицы meta
+
+    Args:
+        key: Ключ значения
+
+    Returns:
+        Значение или None, если его нет
+    """
+    async with db_pool.reader() as db:
+        cursor = await db.execute("""SELECT value FROM meta WHERE key = ?""", (key, ))
+        row = await cursor.fetchone()
+        return row[0] if row else None
+
+async def sync_coins_list(coins: Iterable[Dict[str, str]], content_hash: Optional[str] = None) -> Tuple[int, int]:
+    """
+    Синхронизирует справочник криптовалют со списком CoinGecko
+
+    Записи добавляются и обновляются пачками по COINS_LIST_BATCH через
+    upsert по тикеру; строки, которые не изменились, не перезаписываются.
+    Монеты, которых нет в списке, помечаются временем delisted_at.
+    Если справочник изменился, увеличивается счётчик changes 'coins_list'.
+    Всё выполняется в одной транзакции, в конце сохраняется хеш списка.
+
+    Args:
+        coins: Список в формате [{"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"}, ...]
+        content_hash: Хеш исходного ответа API; None — не сохранять
+
+    Returns:
+        Кортеж (число добавленных или изменённых монет, число помеченных удалёнными)
+    """
+    now = int(time.time())
+    upserted = 0
+    seen = 0
+    delisted = 0
+    coins = iter(coins)
+    async with db_pool.writer() as db:
+        await db.execute("""CREATE TEMP TABLE IF NOT EXISTS coins_list_seen (ticker TEXT PRIMARY KEY)""")
+        await db.execute("""DELETE FROM coins_list_seen""")
+        while batch := [(coin['id'], coin.get('symbol'), coin.get('name')) for coin in islice(coins, COINS_LIST_BATCH)]:
+            await db.executemany("""
+            INSERT OR IGNORE INTO coins_list_seen (ticker) VALUES (?)
+            """, [(ticker, ) for ticker, _, _ in batch])
+            cursor = await db.executemany("""
+            INSERT INTO coins_list (ticker, symbol, name) VALUES (?, ?, ?)
+            ON CONFLICT (ticker) DO UPDATE
+            SET symbol = excluded.symbol, name = excluded.name, delisted_at = NULL
+            WHERE symbol IS NOT excluded.symbol OR name IS NOT excluded.name OR delisted_at IS NOT NULL
+            """, batch)
+            upserted += cursor.rowcount
+            seen += len(batch)
+        # пустой ответ не считаем признаком того, что все монеты удалены
+        if seen:
+            cursor = await db.execute("""
+            UPDATE coins_list SET delisted_at = ?
+            WHERE delisted_at IS NULL AND ticker NOT IN (SELECT ticker FROM coins_list_seen)
+            """, (now, ))
+            delisted = cursor.rowcount
+        if upserted or delisted:
+            # по счётчику другие процессы узнают, что индекс поиска по справочнику устарел
+            await db.execute("""
+            INSERT INTO changes (name, version) VALUES ('coins_list', 1)
+            ON CONFLICT (name) DO UPDATE SET version = version + 1
+            """)
+        if seen and content_hash is not None:
+            await db.execute("""
+            INSERT INTO meta (key, value) VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = excluded.value
+            """, (COINS_LIST_HASH_KEY, content_hash))
+        await db.execute("""DELETE FROM coins_list_seen""")
+        await db.commit()
+    return upserted, delisted
+
+def save_coins_list_snapshot(body: BinaryIO) -> None:
+    """
+    Сохраняет список криптовалют в сжатый снимок config.COINS_LIST_SNAPSHOT
+
+    Функция синхронная, вызывается в отдельном потоке. Снимок пишется
+    во временный файл и атомарно заменяет предыдущий.
+
+    Args:
+        body: Файл с JSON-ответом API
+
+    Returns:
+        None
+    """
+    path = config.COINS_LIST_SNAPSHOT
+    try:
+        body.seek(0)
+        with gzip.open(f'{path}.tmp', 'wb') as snapshot:
+            shutil.copyfileobj(body, snapshot)
+        os.replace(f'{path}.tmp', path)
+    except OSError as error:
+        logger.warning(f'Failed to save coins list snapshot {path}: {error}')
+
+async def update_coins_list(force: bool = False) -> bool:
+    """
+    Загружает список криптовалют из API CoinGecko и синхронизирует справочник
+
+    Если хеш ответа совпадает с сохранённым при прошлой синхронизации,
+    список не разбирается и база не изменяется. Иначе ответ разбирается
+    потоково (iter_json_array) и монеты пачками уходят в sync_coins_list,
+    поэтому весь список никогда не держится в памяти целиком. После
+    синхронизации ответ сохраняется как снимок для следующего первого запуска.
+
+    Args:
+        force: Синхронизировать, даже если список не изменился
+
+    Returns:
+        True, если справочник изменился
+    """
+    body, content_hash = await download_coins_list()
+    with body:
+        if not force and content_hash == await get_meta(COINS_LIST_HASH_KEY):
+            logger.info(f'Coins list is unchanged, sync skipped')
+            return False
+        upserted, delisted = await sync_coins_list(iter_json_array(body), content_hash)
+        await asyncio.to_thread(save_coins_list_snapshot, body)
+    logger.info(f'Coins list synced: {upserted} added or changed, {delisted} delisted')
+    return bool(upserted or delisted)
+
+async def get_subscription_counts() -> Dict[str, int]:
+    """
+    Считает число подписок на каждую криптовалюту
+
+    Returns:
+        Словарь {ticker: число подписчиков}
+    """
+    async with db_pool.reader() as db:
+        cursor = await db.execute("""
+        SELECT ticker, COUNT(*)
+        FROM subscriptions
+        GROUP BY ticker
+        """)
+        return dict(await cursor.fetchall())
+
 async def add_prices(prices: Union[List[Tuple[str, float, int]], List[Dict[str, Any]]]) -> None:
     """
     Добавляет историю цен в базу данных
     
+    Сырые цены записываются в таблицу своего дня (prices_pYYYYMMDD, UTC),
+    новая таблица создаётся при первой цене за день. Вместе с ними в той же
+    транзакции обновляются OHLC-агрегаты всех уровней (ROLLUP_TABLES)
+    и суммы квадратов изменений цены для волатильности.
+    
     Args:
         prices: Список данных о ценах в формате:
                [(ticker, price, timestamp), ...] или
@@ -264,41 +751,191 @@ async def add_prices(prices: Union[List[Tuple[str, float, int]], List[Dict[str,
     Returns:
         None
     """
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.executemany("""
-        INSERT INTO prices (ticker, price, timestamp)
-        VALUES (:ticker, :price, :timestamp)
-        """, prices)
+    rows = [
+        dict(price) if isinstance(price, dict) else {'ticker': price[0], 'price': price[1], 'timestamp': price[2]}
+        for price in prices
+    ]
+    if not rows:
+        return
+    by_day: Dict[int, List[Dict[str, Any]]] = {}
+    for row in rows:
+        by_day.setdefault(int(row['timestamp']) // 86400, []).append(row)
+    async with db_pool.writer() as db:
+        await set_price_changes(db, rows)
+        for day, day_rows in by_day.items():
+            if day not in PRICE_PARTITIONS:
+                await create_price_partition(db, day)
+                PRICE_PARTITIONS.add(day)
+            await db.executemany(f"""
+            INSERT INTO {price_partition(day)} (ticker, price, timestamp)
+            VALUES (:ticker, :price, :timestamp)
+            """, day_rows)
+        for table, resolution in ROLLUP_TABLES:
+            await db.executemany(f"""
+            INSERT INTO {table} (ticker, bucket, open, high, low, close, open_ts, close_ts, samples, squares)
+            VALUES (:ticker, :bucket, :price, :price, :price, :price, :timestamp, :timestamp, 1, :square)
+            ON CONFLICT (ticker, bucket) DO UPDATE SET
+                open = CASE WHEN excluded.open_ts < open_ts THEN excluded.open ELSE open END,
+                high = max(high, excluded.high),
+                low = min(low, excluded.low),
+                close = CASE WHEN excluded.close_ts >= close_ts THEN excluded.close ELSE close END,
+                open_ts = min(open_ts, excluded.open_ts),
+                close_ts = max(close_ts, excluded.close_ts),
+                samples = samples + 1,
+                squares = squares + excluded.squares
+            """, [dict(row, bucket=int(row['timestamp']) // resolution * resolution) for row in rows])
         await db.commit()
 
-async def get_last_prices_for_subs_list(subs: List[Tuple], period: int) -> List[List[Tuple[str, float, int]]]:
+async def set_price_changes(db: aiosqlite.Connection, rows: List[Dict[str, Any]]) -> None:
     """
-    Получает историю цен за указанный период для списка подписок
-    
+    Записывает в каждую новую цену квадрат её изменения от предыдущей выборки тикера
+
+    Предыдущая выборка берётся из новых цен или из последнего интервала
+    самого детального уровня агрегатов за сутки. Для первой выборки тикера
+    и для цен старше уже сохранённых изменение считается нулевым.
+
     Args:
-        subs: Список подписок пользователя
-        period: Период в секундах для получения цен
-        
+        db: Соединение с базой данных для записи
+        rows: Новые цены [{"ticker": ..., "price": ..., "timestamp": ...}, ...], дополняются ключом square
+
     Returns:
-        Список списков с историей цен для каждой подписки
+        None
     """
-    prices = []
-    now = time.time()
-    async with aiosqlite.connect(DB_FILE) as db:
-        for item in subs:
-            try:
-                sub, ticker, last_alert, alert_threshold, interval = item
-            except ValueError:
-                ticker = item[0]
-            cursor = await db.execute("""
-            SELECT ticker, price, timestamp
-            FROM prices
-            WHERE ticker = (?)
-            AND timestamp BETWEEN (?) AND (?)
-            ORDER BY timestamp DESC
-            """, (ticker, now-period, now))
-            prices.append(await cursor.fetchall())
-    return prices
+    table, resolution = ROLLUP_TABLES[0]
+    since = (min(row['timestamp'] for row in rows) - 86400) // resolution * resolution
+    tickers = list({row['ticker'] for row in rows})
+    last: Dict[str, Tuple[float, float]] = {}
+    for first in range(0, len(tickers), TICKERS_BATCH):
+        batch = tickers[first:first + TICKERS_BATCH]
+        cursor = await db.execute(f"""
+        SELECT r.ticker, r.close, r.close_ts
+        FROM (VALUES {', '.join(['(?)'] * len(batch))}) AS t
+        JOIN {table} AS r ON r.ticker = t.column1 AND r.bucket = (
+            SELECT bucket FROM {table} AS l
+            WHERE l.ticker = t.column1 AND l.bucket >= ?
+            ORDER BY l.bucket DESC LIMIT 1
+        )
+        """, (*batch, since))
+        for ticker, close, close_ts in await cursor.fetchall():
+            last[ticker] = (close, close_ts)
+    for row in sorted(rows, key=itemgetter('ticker', 'timestamp')):
+        previous = last.get(row['ticker'])
+        if previous is None or previous[1] >= row['timestamp'] or not previous[0]:
+            row['square'] = 0.0
+        else:
+            row['square'] = (row['price'] / previous[0] - 1) ** 2
+        last[row['ticker']] = (row['price'], row['timestamp'])
+
+async def price_source(db: aiosqlite.Connection, since: float, until: float) -> str:
+    """
+    Собирает источник сырых цен только из дневных таблиц, пересекающих период
+
+    Список таблиц читается из схемы базы при каждом вызове, поэтому
+    учитываются и таблицы, созданные другим процессом. Вместо представления
+    prices запрос не трогает таблицы за дни вне периода.
+
+    Args:
+        db: Соединение с базой данных
+        since: Начало периода, unix time
+        until: Конец периода, unix time
+
+    Returns:
+        Подзапрос для FROM с колонками ticker, price, timestamp
+    """
+    selects = [
+        f"SELECT ticker, price, timestamp FROM {price_partition(day)}"
+        for day in await get_price_partitions(db)
+        if (day + 1) * 86400 > since and day * 86400 <= until
+    ]
+    return f"({' UNION ALL '.join(selects) or 'SELECT NULL AS ticker, NULL AS price, NULL AS timestamp WHERE 0'})"
+
+async def intern_tickers(db: aiosqlite.Connection, tickers: List[str]) -> Dict[str, int]:
+    """
+    Получает целые идентификаторы тикеров, добавляя новые
+
+    Args:
+        db: Соединение с базой данных для записи
+        tickers: Список тикеров
+
+    Returns:
+        Словарь {ticker: id}
+    """
+    await db.executemany("""INSERT OR IGNORE INTO tickers (ticker) VALUES (?)""", [(ticker, ) for ticker in tickers])
+    cursor = await db.execute(f"""
+    SELECT ticker, id FROM tickers
+    WHERE ticker IN ({', '.join('?' * len(tickers))})
+    """, tickers)
+    return dict(await cursor.fetchall())
+
+async def read_price_blocks(db: aiosqlite.Connection, since: float, until: float,
+                            tickers: Optional[List[str]] = None) -> List[Tuple[str, float, int]]:
+    """
+    Читает выборки из упакованных блоков цен за период
+
+    Args:
+        db: Соединение с базой данных
+        since: Начало периода, unix time
+        until: Конец периода, unix time
+        tickers: Тикеры; None — все
+
+    Returns:
+        Список кортежей [(ticker, price, timestamp), ...], по возрастанию времени внутри тикера
+    """
+    query = """
+    SELECT t.ticker, b.start_ts, b.offsets, b.prices
+    FROM price_blocks AS b
+    JOIN tickers AS t ON t.id = b.ticker_id
+    WHERE b.end_ts >= ? AND b.start_ts <= ?
+    """
+    params: List[Any] = [since, until]
+    if tickers is not None:
+        query += f" AND t.ticker IN ({', '.join('?' * len(tickers))})"
+        params += tickers
+    # унарный плюс не даёт выбрать первичный ключ ради порядка: без фильтра
+    # по тикерам блоки отбираются по индексу end_ts, а не полным перебором
+    query += " ORDER BY +b.ticker_id, b.start_ts"
+    cursor = await db.execute(query, params)
+    rows: List[Tuple[str, float, int]] = []
+    for ticker, start, offsets, prices in await cursor.fetchall():
+        timestamps, values = decode_block(start, offsets, prices, since, until)
+        rows.extend(zip(repeat(ticker), values, timestamps))
+    return rows
+
+async def compact_prices() -> int:
+    """
+    Упаковывает сырые цены завершённых дней в блоки
+
+    Работает только при config.PRICE_STORAGE = columnar. Каждая дневная
+    таблица, кроме текущего дня, переносится в price_blocks (блоки по тикерам)
+    и удаляется, в отдельной транзакции.
+
+    Returns:
+        Число упакованных дней
+    """
+    if config.PRICE_STORAGE != 'columnar':
+        return 0
+    today = int(time.time()) // 86400
+    async with db_pool.reader() as db:
+        days = [day for day in await get_price_partitions(db) if day < today]
+    for day in days:
+        table = price_partition(day)
+        async with db_pool.writer() as db:
+            cursor = await db.execute(f"""SELECT ticker, timestamp, price FROM {table} ORDER BY ticker, timestamp""")
+            samples: Dict[str, List[Tuple[int, float]]] = {}
+            for ticker, timestamp, price in await cursor.fetchall():
+                samples.setdefault(ticker, []).append((timestamp, price))
+            if samples:
+                ids = await intern_tickers(db, list(samples))
+                await db.executemany("""
+                INSERT OR REPLACE INTO price_blocks (ticker_id, start_ts, end_ts, samples, offsets, prices)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """, [(ids[ticker], *block) for ticker, rows in samples.items() for block in encode_blocks(rows)])
+            await db.execute(f"""DROP TABLE {table}""")
+            PRICE_PARTITIONS.discard(day)
+            await rebuild_prices_view(db)
+            await db.commit()
+        logger.info(f'Compacted {table}: {sum(map(len, samples.values()))} prices of {len(samples)} tickers')
+    return len(days)
 
 async def get_last_prices_for_ticker(ticker: str, period: int) -> List[Tuple[str, float, int]]:
     """
@@ -312,32 +949,161 @@ async def get_last_prices_for_ticker(ticker: str, period: int) -> List[Tuple[str
         Список кортежей с историей цен: [(ticker, price, timestamp), ...]
     """
     now = time.time()
-    async with aiosqlite.connect(DB_FILE) as db:
-        cursor = await db.execute("""
+    async with db_pool.reader() as db:
+        cursor = await db.execute(f"""
                     SELECT ticker, price, timestamp
-                    FROM prices
+                    FROM {await price_source(db, now - period, now)}
                     WHERE ticker = (?)
                     AND timestamp BETWEEN (?) AND (?)
                     ORDER BY timestamp DESC
                     """, (ticker, now - period, now))
-        return await cursor.fetchall()
+        # упакованные блоки всегда старше дневных таблиц
+        return await cursor.fetchall() + (await read_price_blocks(db, now - period, now, [ticker]))[::-1]
+
+async def get_prices_since(period: int) -> List[Tuple[str, float, int]]:
+    """
+    Получает историю цен всех криптовалют за указанный период
+    
+    Args:
+        period: Период в секундах
+        
+    Returns:
+        Список кортежей по возрастанию времени: [(ticker, price, timestamp), ...]
+    """
+    now = time.time()
+    async with db_pool.reader() as db:
+        packed = await read_price_blocks(db, now - period, now)
+        packed.sort(key=itemgetter(2))
+        cursor = await db.execute(f"""
+        SELECT ticker, price, timestamp
+        FROM {await price_source(db, now - period, now)}
+        WHERE timestamp >= (?)
+        ORDER BY timestamp
+        """, (now - period, ))
+        return packed + await cursor.fetchall()
 
 async def delete_old_prices(period: int) -> None:
     """
     Удаляет старые записи о ценах из базы данных
     
+    Цены хранятся по дням, поэтому удаляются целые дневные таблицы,
+    которые полностью старше периода: до суток более старых цен
+    остаются до следующего дня. Так же целиком удаляются упакованные блоки.
+    
     Args:
         period: Возраст записей в секундах, старше которых нужно удалить
         
+    Returns:
+        None
+    """
+    border = time.time() - period
+    async with db_pool.writer() as db:
+        await db.execute("""DELETE FROM price_blocks WHERE end_ts < ?""", (border, ))
+        days = [day for day in await get_price_partitions(db) if (day + 1) * 86400 <= border]
+        for day in days:
+            await db.execute(f"""DROP TABLE IF EXISTS {price_partition(day)}""")
+            PRICE_PARTITIONS.discard(day)
+        if days:
+            await rebuild_prices_view(db)
+        await db.commit()
+    if days:
+        logger.info(f'Dropped {len(days)} old price partitions')
+
+def rollup_table_for(period: int) -> Tuple[str, int]:
+    """
+    Выбирает уровень агрегатов для статистики за период
+
+    Берётся самый детальный уровень, который хранит весь период
+    и даёт не больше ROLLUP_MAX_BUCKETS интервалов.
+
+    Args:
+        period: Период в секундах
+
+    Returns:
+        Кортеж (таблица, длительность интервала)
+    """
+    for table, resolution in ROLLUP_TABLES:
+        if ROLLUP_RETENTION[table] >= period and period / resolution <= ROLLUP_MAX_BUCKETS:
+            return table, resolution
+    return ROLLUP_TABLES[-1]
+
+async def get_price_stats(tickers: List[str], period: int) -> Dict[str, PriceStats]:
+    """
+    Получает статистику цен криптовалют за период по агрегатам
+
+    Читает не больше ROLLUP_MAX_BUCKETS строк на тикер вместо всех
+    сырых цен за период. Границы периода округляются до интервала
+    выбранного уровня.
+
+    Args:
+        tickers: Список тикеров
+        period: Период в секундах
+
+    Returns:
+        Словарь {ticker: PriceStats}; тикеров без цен за период в нём нет
+    """
+    if not tickers:
+        return {}
+    table, resolution = rollup_table_for(period)
+    since = int(time.time()) - period - resolution
+    placeholders = ', '.join('?' * len(tickers))
+    async with db_pool.reader() as db:
+        cursor = await db.execute(f"""
+        SELECT ticker,
+            (SELECT open FROM {table} AS f WHERE f.ticker = r.ticker AND f.bucket > ? ORDER BY f.bucket LIMIT 1),
+            MAX(high), MIN(low),
+            (SELECT close FROM {table} AS l WHERE l.ticker = r.ticker AND l.bucket > ? ORDER BY l.bucket DESC LIMIT 1),
+            MIN(open_ts), TOTAL(squares)
+        FROM {table} AS r
+        WHERE ticker IN ({placeholders}) AND bucket > ?
+        GROUP BY ticker
+        """, (since, since, *tickers, since))
+        return {
+            ticker: PriceStats(open, high, low, close, open_ts, math.sqrt(squares) * 100)
+            for ticker, open, high, low, close, open_ts, squares in await cursor.fetchall()
+        }
+
+async def get_latest_prices(tickers: List[str], since: float) -> Dict[str, Tuple[float, int]]:
+    """
+    Получает последние цены тикеров из самого подробного агрегата
+
+    Агрегаты обновляет планировщик на каждом тике, поэтому процесс,
+    который сам цены не запрашивает (BOT_ROLE=bot), берёт свежие цены здесь.
+
+    Args:
+        tickers: Тикеры криптовалют
+        since: Цены старше этого момента (unix time) не возвращаются
+
+    Returns:
+        Словарь {ticker: (price, timestamp)}; тикеров без свежей цены в нём нет
+    """
+    if not tickers:
+        return {}
+    table, resolution = ROLLUP_TABLES[0]
+    async with db_pool.reader() as db:
+        # close берётся из строки с наибольшим close_ts
+        cursor = await db.execute(f"""
+        SELECT ticker, close, MAX(close_ts)
+        FROM {table}
+        WHERE ticker IN ({', '.join('?' * len(tickers))}) AND bucket > ? AND close_ts >= ?
+        GROUP BY ticker
+        """, (*tickers, since - resolution, since))
+        return {ticker: (close, close_ts) for ticker, close, close_ts in await cursor.fetchall()}
+
+async def delete_old_rollups() -> None:
+    """
+    Удаляет агрегаты цен старше срока хранения их уровня (ROLLUP_RETENTION)
+
     Returns:
         None
     """
     now = time.time()
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute("""
-        DELETE FROM prices
-        WHERE timestamp < (?)
-        """, (now-period, ))
+    async with db_pool.writer() as db:
+        for table, _ in ROLLUP_TABLES:
+            await db.execute(f"""
+            DELETE FROM {table}
+            WHERE bucket < (?)
+            """, (now - ROLLUP_RETENTION[table], ))
         await db.commit()
 
 async def delete_user_subscription(user_id: int, ticker: str) -> None:
@@ -351,13 +1117,16 @@ async def delete_user_subscription(user_id: int, ticker: str) -> None:
     Returns:
         None
     """
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute("""
+    async with db_pool.writer() as db:
+        cursor = await db.execute("""
         DELETE FROM subscriptions
         WHERE user_id = (?)
         AND ticker = (?)
         """, (user_id, ticker, ))
+        version = await read_change_version(db, 'subscriptions')
         await db.commit()
+    subscription_index.remove(user_id, ticker)
+    subscription_index.advance(version, cursor.rowcount)
 
 async def update_user_subscription(user_id: int, ticker: str, threshold: int = 1, timeout: int = 3600) -> None:
     """
@@ -372,14 +1141,17 @@ async def update_user_subscription(user_id: int, ticker: str, threshold: int = 1
     Returns:
         None
     """
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute("""
+    async with db_pool.writer() as db:
+        cursor = await db.execute("""
         UPDATE subscriptions
         SET alert_threshold = (?), interval = (?)
         WHERE user_id = (?)
         AND ticker = (?)
         """, (threshold, timeout, user_id, ticker))
+        version = await read_change_version(db, 'subscriptions')
         await db.commit()
+    subscription_index.update_settings(user_id, ticker, threshold, timeout)
+    subscription_index.advance(version, cursor.rowcount)
 
 async def get_user_subscriptions_settings(user_id: int, ticker: str) -> List[Tuple[int, int]]:
     """
@@ -392,7 +1164,7 @@ async def get_user_subscriptions_settings(user_id: int, ticker: str) -> List[Tup
     Returns:
         Список кортежей с настройками: [(alert_threshold, interval), ...]
     """
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with db_pool.reader() as db:
         cursor = await db.execute("""
                 SELECT alert_threshold, interval
                 FROM subscriptions
@@ -408,7 +1180,7 @@ async def get_max_interval_from_subscriptions() -> List[Tuple[Optional[int]]]:
     Returns:
         Список кортежей с максимальным интервалом: [(max_interval,), ...]
     """
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with db_pool.reader() as db:
         cursor = await db.execute("""
         SELECT MAX(interval)
         FROM subscriptions
@@ -421,7 +1193,7 @@ async def check_cbrf_subscription(user_id: int) -> bool:
     Returns:
         True or False
     """
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with db_pool.reader() as db:
         cursor = await db.execute("""
         SELECT is_cbrf_subscribed
         FROM users
@@ -440,7 +1212,7 @@ async def cbrf_subscribe(user_id: int, action: bool) -> bool:
     Returns:
         True or False
     """
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with db_pool.writer() as db:
         await db.execute("""
         UPDATE users
         SET is_cbrf_subscribed = (?)
@@ -449,19 +1221,97 @@ async def cbrf_subscribe(user_id: int, action: bool) -> bool:
         await db.commit()
         return True
 
-async def get_cbrf_users() -> tuple[int]:
+async def get_cbrf_users() -> List[int]:
     """
-    Проверяет существование пользователя в базе данных
-
-    Args:
+    Получает пользователей, подписанных на курсы валют ЦБ РФ
 
     Returns:
-        Список кортежей с данными пользователя или пустой список
+        Список идентификаторов пользователей
     """
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with db_pool.reader() as db:
         cursor = await db.execute("""
         SELECT user_id
         FROM users
         WHERE is_cbrf_subscribed = True
         """, ())
-        return (await cursor.fetchall())[0]
\ No newline at end of file
+        return [row[0] for row in await cursor.fetchall()]
+
+async def try_acquire_lock(name: str, owner: str, ttl: float) -> bool:
+    """
+    Захватывает или продлевает именованную блокировку между процессами
+
+    Блокировку можно захватить, если она свободна, принадлежит этому же
+    владельцу или истекла.
+
+    Args:
+        name: Имя блокировки
+        owner: Уникальный идентификатор владельца
+        ttl: Время жизни блокировки в секундах
+
+    Returns:
+        True, если блокировка принадлежит владельцу
+    """
+    now = time.time()
+    async with db_pool.writer() as db:
+        cursor = await db.execute("""
+        INSERT INTO leader_lock (name, owner, expires_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT (name) DO UPDATE
+        SET owner = excluded.owner, expires_at = excluded.expires_at
+        WHERE leader_lock.owner = excluded.owner OR leader_lock.expires_at < (?)
+        """, (name, owner, now + ttl, now))
+        await db.commit()
+        return cursor.rowcount > 0
+
+async def release_lock(name: str, owner: str) -> None:
+    """
+    Освобождает именованную блокировку, если она принадлежит владельцу
+
+    Args:
+        name: Имя блокировки
+        owner: Уникальный идентификатор владельца
+
+    Returns:
+        None
+    """
+    async with db_pool.writer() as db:
+        await db.execute("""
+        DELETE FROM leader_lock
+        WHERE name = (?) AND owner = (?)
+        """, (name, owner))
+        await db.commit()
+
+async def read_change_version(db: aiosqlite.Connection, name: str) -> int:
+    """
+    Читает счётчик изменений таблицы через переданное соединение
+
+    Внутри транзакции записи возвращает значение вместе с её изменениями,
+    до которых другие процессы не могут вклиниться.
+
+    Args:
+        db: Соединение с базой данных
+        name: Имя счётчика, например 'subscriptions'
+
+    Returns:
+        Текущее значение счётчика
+    """
+    cursor = await db.execute("""
+    SELECT version
+    FROM changes
+    WHERE name = (?)
+    """, (name, ))
+    row = await cursor.fetchone()
+    return row[0] if row else 0
+
+async def get_change_version(name: str) -> int:
+    """
+    Получает счётчик изменений таблицы, который увеличивают триггеры
+
+    Args:
+        name: Имя счётчика, например 'subscriptions'
+
+    Returns:
+        Текущее значение счётчика
+    """
+    async with db_pool.reader() as db:
+        return await read_change_version(db, name)
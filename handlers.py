@@ -1,28 +1,29 @@
 import logging
-from difflib import get_close_matches
+import re
+import time
 
 from aiogram import Router, types, F
 from aiogram.filters import Command
 
 from database import add_user, add_subscription, get_user_subscriptions, get_user, add_coin, get_coins, \
-    get_last_prices_for_subs_list, get_coin_from_list, get_coins_from_list, delete_user_subscription, \
+    get_price_stats, get_coin_from_list, wait_coins_list_ready, delete_user_subscription, \
     update_user_subscription, get_user_subscriptions_settings, delete_coins, check_cbrf_subscription, cbrf_subscribe
-from services.coingecko import fetch_prices
+from services.price_cache import price_cache
+from services.coin_search import coin_search, refresh_coin_search
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton, CallbackQuery
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.enums.parse_mode import ParseMode
 from aiogram.utils import markdown
 from aiosqlite import Error as SQLError
-from services.cbr_service import CBRService
+from services.cbr_service import cbr_rates
 
 logger = logging.getLogger(__name__)
 router = Router()
 
-USD_CBR = CBRService('USD', period='W')
-EUR_CBR = CBRService('EUR', period='W')
-
 available_tickers = {"BitCoin": "bitcoin", "DogeCoin": "dogecoin", "Ethereum": "ethereum", "Other": "other"}
+# периоды статистики в разделе «Текущие цены»: {секунды: подпись}
+STATS_PERIODS = {86400: '24 часа', 604800: '7 дней', 2592000: '30 дней'}
 
 class SubscribeState(StatesGroup):
     waiting_for_ticker = State()
@@ -157,7 +158,7 @@ async def callback_subscribe(callback: types.CallbackQuery, state: FSMContext) -
         await state.set_state(SubscribeState.waiting_for_ticker)
     else:
         if await add_sub_to_db(callback.from_user.id, slug):
-            await fetch_prices([slug])
+            await price_cache.get_or_fetch([slug])
             logger.debug(f'User {callback.from_user.id} is not subscribed to {slug}')
             await callback.message.answer("Подписка добавлена!")
             await callback.message.answer(f"Вы подписались на {slug}")
@@ -173,6 +174,9 @@ async def process_manual_ticker(message: types.Message, state: FSMContext) -> No
     """
     Обработчик ручного ввода названия криптовалюты
     
+    Если тикер не найден, предлагает монеты из индекса coin_search:
+    сначала точные совпадения по символу или названию, затем похожие.
+    
     Args:
         message: Сообщение с названием криптовалюты
         state: Контекст состояния FSM
@@ -197,9 +201,12 @@ async def process_manual_ticker(message: types.Message, state: FSMContext) -> No
 
     ticker = text.lower()
     success = False
-    if not ticker.isalpha():
+    if not re.fullmatch(r'[\w .\-]{1,64}', ticker):
         await message.answer("Некорректный тикер. Попробуйте ещё раз.")
         return
+    if not await wait_coins_list_ready():
+        await message.answer('Справочник монет ещё загружается. Попробуйте через минуту.')
+        return
     try:
         if not await get_coin_from_list(ticker):
             raise SQLError(f'Ticker not found')
@@ -210,16 +217,20 @@ async def process_manual_ticker(message: types.Message, state: FSMContext) -> No
             await message.answer(f'Вы уже были подписаны на {ticker} ранее')
         success = True
     except SQLError as error:
-        coins = await get_coins_from_list()
-        coins_list = []
-        for coin in coins:
-            coins_list.append(coin[0])
-        similar = get_close_matches(message.text.strip().lower(), coins_list)
-        await message.answer('Нет такой монеты')
+        await refresh_coin_search()
+        similar = coin_search.exact(ticker)
+        for coin in coin_search.search(ticker):
+            if coin not in similar:
+                similar.append(coin)
+        similar = similar[:5]
+        if not similar:
+            await message.answer('Нет такой монеты. Попробуйте ещё раз.')
+            return
+        await message.answer('Нет монеты с таким тикером')
         # await message.reply(f'Возможно имелось ввиду {similar[0]}?')
         kb = InlineKeyboardMarkup(
             inline_keyboard=[
-                [InlineKeyboardButton(text=s, callback_data=f"sub:{s}")] for s in similar
+                [InlineKeyboardButton(text=f'{name} ({symbol.upper()})', callback_data=f"sub:{s}")] for s, symbol, name in similar
             ] + [[InlineKeyboardButton(text='Отмена', callback_data=f'cancel:')]]
         )
         await message.reply('Возможно имелось ввиду:', reply_markup=kb)
@@ -291,6 +302,9 @@ async def handle_get_prices(message: types.Message) -> None:
     """
     Показывает текущие цены и статистику по подписанным криптовалютам
     
+    Статистика за 24 часа, 7 и 30 дней, включая волатильность, берётся
+    из агрегатов цен (get_price_stats) — по одному запросу на период.
+    
     Args:
         message: Сообщение от пользователя
         
@@ -300,24 +314,34 @@ async def handle_get_prices(message: types.Message) -> None:
     logger.debug(f'Try to get current prices')
     subs = await get_user_subscriptions(message.from_user.id)
     logger.debug(f'User\'s subs: {subs}')
-    prices = await get_last_prices_for_subs_list(subs, 86400)
-    logger.debug(f'Last prices: {prices}')
+    tickers = [ticker for user_id, ticker, last_alert, alert_threshold, interval in subs]
+    stats = {period: await get_price_stats(tickers, period) for period in STATS_PERIODS}
+    logger.debug(f'Price stats: {stats}')
+    day_stats = stats[86400]
+    quotes = await price_cache.get_or_fetch([ticker for ticker in tickers if ticker in day_stats])
     answer = 'Текущие цены:\n'
-    # prices = sorted(prices, key=lambda x: x[2])
-    for price in prices:
-        if price:
-            current_price = price[0]  # Последняя цена из БД
-            last_price = price[-1]  # Самая ранняя цена из БД, но не ранее 24 часов
-            min_price = min(price, key=lambda item: item[1])
-            max_price = max(price, key=lambda item: item[1])
-            logger.debug(f'Current price for {current_price[0]} = {current_price[1]}, Last price = {last_price[1]}')
-            diff = (current_price[1] - last_price[1]) / last_price[1] * 100
-            diff_sign = '👎' if diff < 0 else '👍'
-            answer += (f'{diff_sign} {markdown.bold(current_price[0].upper())}:\n'
-                       f'Текущая цена \\- {markdown.code(f'${current_price[1]}')}\n'
-                       f'Изменение за 24 часа \\= {markdown.bold(f'{round(diff, 2)}%')}\n'
-                       f'Минимум за 24 часа \\= {markdown.code(f'${min_price[1]}')}\n'
-                       f'Максимум за 24 часа \\= {markdown.code(f'${max_price[1]}')}\n\n')
+    for ticker in tickers:
+        if ticker not in day_stats:
+            continue
+        day = day_stats[ticker]
+        current_price = quotes.get(ticker, day.close)  # Цена из кэша, иначе последняя цена из БД
+        logger.debug(f'Current price for {ticker} = {current_price}, Open price = {day.open}')
+        diff = (current_price - day.open) / day.open * 100
+        diff_sign = '👎' if diff < 0 else '👍'
+        answer += (f'{diff_sign} {markdown.bold(ticker.upper())}:\n'
+                   f'Текущая цена \\- {markdown.code(f'${current_price}')}\n'
+                   f'Изменение за 24 часа \\= {markdown.bold(f'{round(diff, 2)}%')}\n'
+                   f'Минимум за 24 часа \\= {markdown.code(f'${day.low}')}\n'
+                   f'Максимум за 24 часа \\= {markdown.code(f'${day.high}')}\n'
+                   f'Волатильность за 24 часа \\= {markdown.bold(f'{round(day.volatility, 2)}%')}\n')
+        for period, title in STATS_PERIODS.items():
+            period_stats = stats[period].get(ticker)
+            # изменение за длинный период показываем, только если история его покрывает
+            if period == 86400 or period_stats is None or period_stats.since > time.time() - period * 0.9:
+                continue
+            period_diff = (current_price - period_stats.open) / period_stats.open * 100
+            answer += f'Изменение за {title} \\= {markdown.bold(f'{round(period_diff, 2)}%')}\n'
+        answer += '\n'
     if answer == 'Текущие цены:\n':
         await message.answer('Цены ещё не обновлены')
     else:
@@ -475,12 +499,11 @@ async def process_ticker_setting(message: types.Message, state: FSMContext) -> N
 
 @router.message(F.text == 'Курсы валют ЦБ')
 async def get_cbr_currencies(message: types.Message):
-    await USD_CBR.update_rates()
-    await EUR_CBR.update_rates()
+    await cbr_rates.ensure_fresh()
     answer = ''
-    if await USD_CBR.is_updated() or await EUR_CBR.is_updated():
+    if await cbr_rates.is_updated():
         answer = answer.join(f'ЦБ РФ обновил курсы валют на сегодня\n\n')
-    currency = f'{await USD_CBR.get_last_rate()}\n___________________________________\n\n{await EUR_CBR.get_last_rate()}'
+    currency = await cbr_rates.get_last_rates()
     answer += currency
     action = True if await check_cbrf_subscription(message.from_user.id) else False
     action_text = f'Подписаться' if not action else f'Отписаться'
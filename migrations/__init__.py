@@ -0,0 +1,398 @@
+"""
+Версионированные миграции схемы базы данных
+
+Текущая версия схемы хранится в PRAGMA user_version. При старте бота
+init_db() применяет по порядку все миграции, номер которых больше текущей
+версии, каждую в своей транзакции.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Set, Tuple
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+Migration = Callable[[aiosqlite.Connection], Awaitable[None]]
+
+
+async def _get_columns(db: aiosqlite.Connection, table: str) -> Set[str]:
+    """
+    Получает имена колонок таблицы
+
+    Args:
+        db: Соединение с базой данных
+        table: Имя таблицы
+
+    Returns:
+        Множество имён колонок
+    """
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in await cursor.fetchall()}
+
+
+async def _0001_initial(db: aiosqlite.Connection) -> None:
+    """
+    Создаёт базовые таблицы
+    """
+    await db.execute("""CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, is_cbrf_subscribed BOOLEAN DEFAULT FALSE)""")
+    await db.execute("""CREATE TABLE IF NOT EXISTS subscriptions (user_id INTEGER, ticker TEXT, last_alert INTEGER, alert_threshold INTEGER, interval INTEGER)""")
+    await db.execute("""CREATE TABLE IF NOT EXISTS prices (ticker TEXT, price REAL, timestamp INTEGER)""")
+    await db.execute("""CREATE TABLE IF NOT EXISTS coins (id INTEGER PRIMARY KEY, ticker TEXT)""")
+    await db.execute("""CREATE TABLE IF NOT EXISTS coins_list (id INTEGER PRIMARY KEY, ticker TEXT, symbol TEXT, name TEXT)""")
+
+
+async def _0002_legacy_columns(db: aiosqlite.Connection) -> None:
+    """
+    Добавляет колонки, которых нет в базах, созданных старыми версиями бота
+    (бывшие скрипты migrations/0001.py и migrations/0002.py)
+    """
+    columns = await _get_columns(db, 'subscriptions')
+    if 'alert_threshold' not in columns:
+        await db.execute("""ALTER TABLE subscriptions ADD COLUMN alert_threshold INTEGER DEFAULT 1""")
+    if 'interval' not in columns:
+        await db.execute("""ALTER TABLE subscriptions ADD COLUMN interval INTEGER DEFAULT 3600""")
+    if 'is_cbrf_subscribed' not in await _get_columns(db, 'users'):
+        await db.execute("""ALTER TABLE users ADD COLUMN is_cbrf_subscribed BOOLEAN DEFAULT False""")
+
+
+async def _0003_indexes(db: aiosqlite.Connection) -> None:
+    """
+    Добавляет индексы для частых запросов и уникальные ключи
+
+    Перед созданием уникальных индексов удаляет дубликаты, оставляя
+    самую раннюю запись.
+    """
+    await db.execute("""
+    DELETE FROM subscriptions
+    WHERE rowid NOT IN (SELECT MIN(rowid) FROM subscriptions GROUP BY user_id, ticker)
+    """)
+    await db.execute("""
+    DELETE FROM coins
+    WHERE rowid NOT IN (SELECT MIN(rowid) FROM coins GROUP BY ticker)
+    """)
+    await db.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_subscriptions_user_ticker ON subscriptions (user_id, ticker)""")
+    await db.execute("""CREATE INDEX IF NOT EXISTS idx_subscriptions_ticker ON subscriptions (ticker)""")
+    await db.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_coins_ticker ON coins (ticker)""")
+    await db.execute("""CREATE INDEX IF NOT EXISTS idx_coins_list_ticker ON coins_list (ticker)""")
+    await db.execute("""CREATE INDEX IF NOT EXISTS idx_prices_ticker_timestamp ON prices (ticker, timestamp)""")
+    await db.execute("""CREATE INDEX IF NOT EXISTS idx_prices_timestamp ON prices (timestamp)""")
+    await db.execute("""CREATE INDEX IF NOT EXISTS idx_users_cbrf ON users (is_cbrf_subscribed)""")
+
+
+async def _0004_process_coordination(db: aiosqlite.Connection) -> None:
+    """
+    Добавляет таблицы для согласования нескольких процессов бота
+
+    leader_lock хранит блокировку, которая гарантирует единственный активный
+    планировщик. Счётчик в changes увеличивается триггерами при любом изменении
+    подписок, по нему процесс планировщика узнаёт, что индекс подписок устарел.
+    """
+    await db.execute("""CREATE TABLE IF NOT EXISTS leader_lock (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)""")
+    await db.execute("""CREATE TABLE IF NOT EXISTS changes (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)""")
+    await db.execute("""INSERT OR IGNORE INTO changes (name, version) VALUES ('subscriptions', 0)""")
+    for event in ('INSERT', 'DELETE', 'UPDATE OF user_id, ticker, alert_threshold, interval'):
+        trigger = f"subscriptions_changed_{event.split()[0].lower()}"
+        await db.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {trigger} AFTER {event} ON subscriptions
+        BEGIN
+            UPDATE changes SET version = version + 1 WHERE name = 'subscriptions';
+        END
+        """)
+
+
+async def _0005_coins_list_sync(db: aiosqlite.Connection) -> None:
+    """
+    Готовит справочник coins_list к инкрементальной синхронизации
+
+    Тикер становится уникальным ключом (дубликаты удаляются, остаётся самая
+    ранняя запись), delisted_at хранит время, когда монета пропала из списка
+    CoinGecko. Таблица meta хранит служебные значения, например хеш
+    последнего загруженного списка.
+    """
+    await db.execute("""
+    DELETE FROM coins_list
+    WHERE rowid NOT IN (SELECT MIN(rowid) FROM coins_list GROUP BY ticker)
+    """)
+    await db.execute("""DROP INDEX IF EXISTS idx_coins_list_ticker""")
+    await db.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_coins_list_ticker ON coins_list (ticker)""")
+    if 'delisted_at' not in await _get_columns(db, 'coins_list'):
+        await db.execute("""ALTER TABLE coins_list ADD COLUMN delisted_at INTEGER""")
+    await db.execute("""CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)""")
+
+
+# уровни прореженной истории цен: (таблица, длительность интервала в секундах)
+ROLLUP_TABLES: Tuple[Tuple[str, int], ...] = (
+    ('prices_5m', 300),
+    ('prices_1h', 3600),
+    ('prices_1d', 86400),
+)
+
+
+async def _0006_price_rollups(db: aiosqlite.Connection) -> None:
+    """
+    Добавляет таблицы OHLC-агрегатов цен за 5 минут, час и сутки
+
+    Каждая строка описывает один интервал (bucket — его начало в unix time):
+    цены открытия, максимума, минимума и закрытия, время первой и последней
+    выборки и их число. Таблицы заполняются по уже накопленной истории.
+    """
+    for table, resolution in ROLLUP_TABLES:
+        await db.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            ticker TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            open REAL NOT NULL,
+            high REAL NOT NULL,
+            low REAL NOT NULL,
+            close REAL NOT NULL,
+            open_ts INTEGER NOT NULL,
+            close_ts INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            PRIMARY KEY (ticker, bucket)
+        ) WITHOUT ROWID
+        """)
+        await db.execute(f"""CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table} (bucket)""")
+        await db.execute(f"""
+        INSERT OR IGNORE INTO {table} (ticker, bucket, open, high, low, close, open_ts, close_ts, samples)
+        SELECT ticker, bucket,
+            (SELECT price FROM prices AS p WHERE p.ticker = g.ticker AND p.timestamp = g.open_ts LIMIT 1),
+            high, low,
+            (SELECT price FROM prices AS p WHERE p.ticker = g.ticker AND p.timestamp = g.close_ts LIMIT 1),
+            open_ts, close_ts, samples
+        FROM (
+            SELECT ticker, CAST(timestamp AS INTEGER) / {resolution} * {resolution} AS bucket,
+                MAX(price) AS high, MIN(price) AS low,
+                MIN(timestamp) AS open_ts, MAX(timestamp) AS close_ts, COUNT(*) AS samples
+            FROM prices
+            GROUP BY ticker, bucket
+        ) AS g
+        """)
+
+
+def price_partition(day: int) -> str:
+    """
+    Получает имя таблицы сырых цен за день
+
+    Args:
+        day: Номер дня от начала эпохи (timestamp // 86400, UTC)
+
+    Returns:
+        Имя таблицы вида prices_p20240131
+    """
+    return f"prices_p{datetime.fromtimestamp(day * 86400, tz=timezone.utc):%Y%m%d}"
+
+
+async def get_price_partitions(db: aiosqlite.Connection) -> List[int]:
+    """
+    Получает дни, для которых есть таблицы сырых цен
+
+    Args:
+        db: Соединение с базой данных
+
+    Returns:
+        Номера дней по возрастанию
+    """
+    cursor = await db.execute("""
+    SELECT name FROM sqlite_master
+    WHERE type = 'table' AND name GLOB 'prices_p[0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9]'
+    """)
+    days = []
+    for (name, ) in await cursor.fetchall():
+        moment = datetime.strptime(name[len('prices_p'):], '%Y%m%d').replace(tzinfo=timezone.utc)
+        days.append(int(moment.timestamp()) // 86400)
+    return sorted(days)
+
+
+async def rebuild_prices_view(db: aiosqlite.Connection) -> None:
+    """
+    Пересоздаёт представление prices, объединяющее все дневные таблицы цен
+
+    Условия запросов к представлению SQLite переносит внутрь каждой
+    ветви UNION ALL, поэтому в каждой таблице используется её индекс.
+
+    Args:
+        db: Соединение с базой данных для записи
+
+    Returns:
+        None
+    """
+    selects = [f"SELECT ticker, price, timestamp FROM {price_partition(day)}" for day in await get_price_partitions(db)]
+    await db.execute("""DROP VIEW IF EXISTS prices""")
+    await db.execute(f"""
+    CREATE VIEW prices AS
+    {' UNION ALL '.join(selects) or 'SELECT NULL AS ticker, NULL AS price, NULL AS timestamp WHERE 0'}
+    """)
+
+
+async def create_price_partition(db: aiosqlite.Connection, day: int) -> None:
+    """
+    Создаёт таблицу сырых цен за день и добавляет её в представление prices
+
+    Args:
+        db: Соединение с базой данных для записи
+        day: Номер дня от начала эпохи
+
+    Returns:
+        None
+    """
+    table = price_partition(day)
+    await db.execute(f"""CREATE TABLE IF NOT EXISTS {table} (ticker TEXT, price REAL, timestamp INTEGER)""")
+    await db.execute(f"""CREATE INDEX IF NOT EXISTS idx_{table}_ticker_timestamp ON {table} (ticker, timestamp)""")
+    await db.execute(f"""CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table} (timestamp)""")
+    await rebuild_prices_view(db)
+
+
+async def _0007_price_partitions(db: aiosqlite.Connection) -> None:
+    """
+    Разбивает сырые цены на таблицы по дням
+
+    Строки из таблицы prices переносятся в таблицы prices_pYYYYMMDD,
+    а prices становится представлением над ними. Удаление старых цен
+    превращается в DROP TABLE вместо DELETE по всей таблице.
+    """
+    cursor = await db.execute("""SELECT DISTINCT CAST(timestamp AS INTEGER) / 86400 FROM prices""")
+    for (day, ) in await cursor.fetchall():
+        table = price_partition(day)
+        await db.execute(f"""CREATE TABLE IF NOT EXISTS {table} (ticker TEXT, price REAL, timestamp INTEGER)""")
+        await db.execute(f"""
+        INSERT INTO {table} (ticker, price, timestamp)
+        SELECT ticker, price, timestamp FROM prices
+        WHERE timestamp >= ? AND timestamp < ?
+        ORDER BY ticker, timestamp
+        """, (day * 86400, (day + 1) * 86400))
+        await db.execute(f"""CREATE INDEX IF NOT EXISTS idx_{table}_ticker_timestamp ON {table} (ticker, timestamp)""")
+        await db.execute(f"""CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table} (timestamp)""")
+    await db.execute("""DROP TABLE prices""")
+    await rebuild_prices_view(db)
+
+
+async def _0008_price_blocks(db: aiosqlite.Connection) -> None:
+    """
+    Добавляет компактное хранилище истории цен
+
+    tickers сопоставляет тикерам целые идентификаторы, price_blocks хранит
+    выборки одного тикера блоками: смещения времени и цены упакованы в BLOB
+    (см. services/price_blocks.py).
+    """
+    await db.execute("""CREATE TABLE IF NOT EXISTS tickers (id INTEGER PRIMARY KEY, ticker TEXT NOT NULL UNIQUE)""")
+    await db.execute("""
+    CREATE TABLE IF NOT EXISTS price_blocks (
+        ticker_id INTEGER NOT NULL,
+        start_ts INTEGER NOT NULL,
+        end_ts INTEGER NOT NULL,
+        samples INTEGER NOT NULL,
+        offsets BLOB NOT NULL,
+        prices BLOB NOT NULL,
+        PRIMARY KEY (ticker_id, start_ts)
+    ) WITHOUT ROWID
+    """)
+
+
+async def _0009_rollup_volatility(db: aiosqlite.Connection) -> None:
+    """
+    Добавляет в агрегаты цен сумму квадратов изменений цены
+
+    squares — сумма квадратов относительных изменений цены от предыдущей
+    выборки тикера до каждой выборки интервала. Корень из суммы по интервалам
+    периода даёт реализованную волатильность без чтения сырых цен.
+    Заполняется по сырым ценам, которые ещё хранятся.
+    """
+    await db.execute("""
+    CREATE TEMP TABLE price_changes AS
+    SELECT ticker, timestamp, price / LAG(price) OVER (PARTITION BY ticker ORDER BY timestamp) - 1 AS change
+    FROM prices
+    """)
+    for table, resolution in ROLLUP_TABLES:
+        if 'squares' not in await _get_columns(db, table):
+            await db.execute(f"""ALTER TABLE {table} ADD COLUMN squares REAL NOT NULL DEFAULT 0""")
+        await db.execute(f"""
+        CREATE TEMP TABLE {table}_squares AS
+        SELECT ticker, CAST(timestamp AS INTEGER) / {resolution} * {resolution} AS bucket, TOTAL(change * change) AS squares
+        FROM price_changes
+        GROUP BY ticker, bucket
+        """)
+        await db.execute(f"""CREATE UNIQUE INDEX temp.idx_{table}_squares ON {table}_squares (ticker, bucket)""")
+        await db.execute(f"""
+        UPDATE {table} SET squares = (
+            SELECT s.squares FROM {table}_squares AS s
+            WHERE s.ticker = {table}.ticker AND s.bucket = {table}.bucket
+        )
+        WHERE EXISTS (
+            SELECT 1 FROM {table}_squares AS s
+            WHERE s.ticker = {table}.ticker AND s.bucket = {table}.bucket
+        )
+        """)
+        await db.execute(f"""DROP TABLE temp.{table}_squares""")
+    await db.execute("""DROP TABLE temp.price_changes""")
+
+
+async def _0010_price_blocks_end_index(db: aiosqlite.Connection) -> None:
+    """
+    Добавляет индекс по концу блока цен
+
+    Удаление устаревших блоков и чтение всех тикеров за период отбирают
+    блоки по end_ts, а первичный ключ начинается с ticker_id.
+    """
+    await db.execute("""CREATE INDEX IF NOT EXISTS idx_price_blocks_end_ts ON price_blocks (end_ts)""")
+
+
+MIGRATIONS: List[Tuple[int, Migration]] = [
+    (1, _0001_initial),
+    (2, _0002_legacy_columns),
+    (3, _0003_indexes),
+    (4, _0004_process_coordination),
+    (5, _0005_coins_list_sync),
+    (6, _0006_price_rollups),
+    (7, _0007_price_partitions),
+    (8, _0008_price_blocks),
+    (9, _0009_rollup_volatility),
+    (10, _0010_price_blocks_end_index),
+]
+
+
+async def get_schema_version(db: aiosqlite.Connection) -> int:
+    """
+    Получает текущую версию схемы базы данных
+
+    Args:
+        db: Соединение с базой данных
+
+    Returns:
+        Номер версии схемы
+    """
+    cursor = await db.execute("PRAGMA user_version")
+    row = await cursor.fetchone()
+    return row[0]
+
+
+async def migrate(db: aiosqlite.Connection) -> int:
+    """
+    Применяет все недостающие миграции
+
+    Args:
+        db: Соединение с базой данных для записи
+
+    Returns:
+        Версия схемы после применения миграций
+    """
+    version = await get_schema_version(db)
+    for number, migration in MIGRATIONS:
+        if number <= version:
+            continue
+        try:
+            # BEGIN IMMEDIATE сразу берёт блокировку на запись, поэтому
+            # несколько одновременно стартующих процессов применят миграцию один раз
+            await db.execute("BEGIN IMMEDIATE")
+            if await get_schema_version(db) >= number:
+                await db.rollback()
+                continue
+            logger.info(f'Applying migration {number}: {migration.__name__}')
+            await migration(db)
+            await db.execute(f"PRAGMA user_version = {number}")
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        version = number
+    return version
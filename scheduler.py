@@ -1,15 +1,26 @@
+import asyncio
 import logging
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from database import get_coins, add_coins_to_list, get_coins_from_list, add_prices, get_user_subscriptions_by_ticker, delete_old_prices, update_last_alert, \
-    get_last_prices_for_ticker, get_cbrf_users
-from services.cbr_service import CBRService
-from services.coingecko import fetch_prices, fetch_coins_list
+from apscheduler.schedulers.base import STATE_PAUSED, STATE_RUNNING
+from database import get_coins, update_coins_list, add_prices, get_subscriptions_by_ticker, delete_old_prices, update_last_alerts, \
+    delete_old_rollups, compact_prices, vacuum_db, RAW_PRICES_RETENTION, get_prices_since, get_cbrf_users, get_change_version
+from services.cbr_service import cbr_rates
+from services.price_window import price_windows
+from services.price_snapshot import price_snapshot
+from services.subscription_index import subscription_index, BucketKey
+from services.alerts import evaluate_alerts, alert_ledger
+from services.delivery import delivery_queue
+from services.price_cache import price_cache
+from services.leader import scheduler_lock
+from services.coin_search import refresh_coin_search
+from services.coingecko import fetch_prices
 from aiogram import Bot
 from aiogram.enums.parse_mode import ParseMode
 from aiogram.utils import markdown
 import time
+from functools import partial
 from datetime import datetime, timezone, timedelta
-from typing import List, Dict, Tuple, Set
+from typing import List, Dict, Tuple, Set, Optional
 
 from config.config import config
 
@@ -18,9 +29,9 @@ logger = logging.getLogger(__name__)
 # ALERT_THRESHOLD = 0.01
 # Интервал уведомлений
 # INTERVAL = 3600
-USD_CBR = CBRService('USD', period='W')
-EUR_CBR = CBRService('EUR', period='W')
 LAST_CBRF_ALERT: datetime = datetime.now() - timedelta(days=1)
+SCHEDULER: Optional[AsyncIOScheduler] = None
+LEADERSHIP_TASK: Optional[asyncio.Task] = None
 
 
 def is_cbrf_alert_need() -> bool:
@@ -31,26 +42,78 @@ def is_cbrf_alert_need() -> bool:
         return False
 
 
-async def get_subscribed_users(coins: List[Tuple[str]]) -> Tuple[Set[str], Dict[str, List[Tuple[int, float, int, int]]]]:
+async def get_subscribed_users(coins: List[Tuple[str]]) -> Tuple[Set[str], Dict[str, Dict[BucketKey, Dict[int, float]]]]:
     """
     Получает список пользователей, подписанных на отслеживаемые криптовалюты
     
+    Подписки берутся из in-memory индекса; из базы он загружается одним
+    запросом при первом обращении и когда подписки изменил другой процесс.
+    
     Args:
         coins: Список отслеживаемых криптовалют
         
     Returns:
-        Кортеж из множества тикеров и словаря с подписками пользователей
+        Кортеж из множества тикеров и словаря с подписчиками, разложенными
+        по корзинам {ticker: {(alert_threshold, interval): {user_id: last_alert}}}
     """
-    user_map: Dict[str, List[Tuple[int, float, int, int]]] = {}
+    version = await get_change_version('subscriptions')
+    if not subscription_index.loaded or subscription_index.version != version:
+        subscription_index.load(await get_subscriptions_by_ticker(), version)
+    user_map: Dict[str, Dict[BucketKey, Dict[int, float]]] = {}
     tickers: Set[str] = set()
     for ticker in coins:  # получаем список юзеров, подписанных на обновления
         tickers.add(ticker[0])
-        user_map[ticker[0]] = await get_user_subscriptions_by_ticker(ticker[0])
+        user_map[ticker[0]] = subscription_index.buckets(ticker[0])
     return tickers, user_map
 
+async def warm_price_windows() -> None:
+    """
+    Заполняет скользящие окна цен историей при старте
+    
+    Сначала окна заполняются из снимка истории (services/price_snapshot.py)
+    без чтения базы, затем из базы дочитываются только цены новее снимка.
+    Если снимка нет, он создаётся из прочитанной истории.
+    
+    Returns:
+        None
+    """
+    now = time.time()
+    since = now - price_windows.span
+    series, covered = await asyncio.to_thread(price_snapshot.read, since)
+    count = 0
+    for ticker, view in series.items():
+        price_windows.extend(ticker, view.timestamps, view.prices)
+        count += len(view.prices)
+    price_snapshot.close()
+    if series:
+        logger.info(f'Price windows warmed from snapshot with {count} samples for {len(series)} tickers')
+    rows = await get_prices_since(now - max(covered or since, since))
+    price_windows.warm(rows)
+    if not series and rows:
+        await write_price_snapshot(rows)
+
+async def write_price_snapshot(rows: Optional[List[Tuple[str, float, int]]] = None) -> None:
+    """
+    Перезаписывает снимок истории цен за сутки
+    
+    Args:
+        rows: История [(ticker, price, timestamp), ...] по возрастанию времени,
+            по умолчанию читается из базы данных
+        
+    Returns:
+        None
+    """
+    try:
+        async with price_snapshot.lock:
+            if rows is None:
+                rows = await get_prices_since(price_windows.span)
+            await asyncio.to_thread(price_snapshot.rewrite, rows)
+    except OSError as error:
+        logger.error(f'Failed to write price snapshot: {error}')
+
 async def add_new_prices(prices: Dict[str, Dict[str, float]], now: float) -> None:
     """
-    Добавляет новые цены криптовалют в базу данных
+    Добавляет новые цены криптовалют в базу данных, снимок истории и скользящие окна
     
     Args:
         prices: Словарь с ценами в формате {ticker: {"usd": price}}
@@ -66,13 +129,24 @@ async def add_new_prices(prices: Dict[str, Dict[str, float]], now: float) -> Non
             continue
         new_prices.append((price, usd, now))
     await add_prices(new_prices)  # добавляем текущие цены в БД
+    try:
+        async with price_snapshot.lock:
+            await asyncio.to_thread(price_snapshot.append, new_prices)
+    except OSError as error:
+        logger.error(f'Failed to append to price snapshot: {error}')
+    for ticker, usd, timestamp in new_prices:
+        price_windows.add(ticker, timestamp, usd)
 
-async def send_message(bot: Bot, ticker: str, now: float, timestamp: float, subscription: List[Tuple[int, float, int, int]], diff: float, current_price: float) -> None:
+async def send_message(ticker: str, now: float, timestamp: float, subscription: List[Tuple[int, float, int, int]], diff: float, current_price: float) -> None:
     """
-    Отправляет уведомление пользователям о значительном изменении цены
+    Ставит в очередь доставки уведомления пользователям о значительном изменении цены
+    
+    Время последнего уведомления сразу обновляется в индексе подписок,
+    чтобы следующий тик не продублировал сообщение, пока оно ждёт отправки;
+    после успешной доставки отметка попадает в alert_ledger и записывается
+    в базу пакетно через flush_last_alerts().
     
     Args:
-        bot: Экземпляр Telegram бота
         ticker: Тикер криптовалюты
         now: Текущее время
         timestamp: Время последнего изменения цены
@@ -107,15 +181,28 @@ async def send_message(bot: Bot, ticker: str, now: float, timestamp: float, subs
     logger.debug(f'Message to send: {msg}')
     for user, last_alert, alert_threshold, interval in subscription:
         if now - last_alert > interval:
-            await bot.send_message(user, msg, parse_mode=ParseMode.MARKDOWN_V2)
-            await update_last_alert(user, ticker)
+            subscription_index.set_last_alert(user, ticker, now)
+            delivery_queue.enqueue(user, msg, parse_mode=ParseMode.MARKDOWN_V2, on_delivered=partial(alert_ledger.record, user, ticker, now))
+
+async def flush_last_alerts() -> None:
+    """
+    Записывает в базу накопленные отметки об отправленных уведомлениях
+    
+    Returns:
+        None
+    """
+    alerts = alert_ledger.drain()
+    if alerts:
+        await update_last_alerts(alerts)
+        logger.debug(f'Flushed {len(alerts)} last alert updates')
 
 async def check_prices(bot: Bot) -> None:
     """
     Основная функция проверки цен и отправки уведомлений
     
-    Получает текущие цены, сравнивает с историческими данными
-    и отправляет уведомления при превышении пороговых значений
+    Получает текущие цены, сравнивает с минимумом и максимумом
+    в скользящем окне цен и отправляет уведомления тем подписчикам,
+    чьи собственные пороговые значения превышены
     
     Args:
         bot: Экземпляр Telegram бота
@@ -132,32 +219,28 @@ async def check_prices(bot: Bot) -> None:
     logger.debug(f'Tickers: {tickers}')
     prices = await fetch_prices(list(tickers))
     now = int(time.time())
+    price_cache.update(prices, now)
     await add_new_prices(prices, now)
-    for ticker, sub in user_map.items():
-        threshold = (sub[0][2]) / 100
-        interval = sub[0][3]
-        price_history = await get_last_prices_for_ticker(ticker, interval)
+    for ticker, buckets in user_map.items():
         current_price = prices.get(ticker, {}).get('usd')
-        if current_price is None:
+        window = price_windows.get(ticker)
+        if not buckets or current_price is None or window is None:
             continue
-        # history = [x for y in price_history for x in y if ticker in x]
-        for ticker_name, price, timestamp in price_history:
-            if abs(current_price - price)/price > threshold:
-                diff = round((current_price - price)/price * 100, 2)
-                await send_message(
-                    bot=bot,
-                    ticker=ticker,
-                    now=now,
-                    timestamp=timestamp,
-                    subscription=sub,
-                    diff=diff,
-                    current_price=current_price,
-                )
-                break
+        for alert in evaluate_alerts(window, buckets, current_price, now):
+            await send_message(
+                ticker=ticker,
+                now=now,
+                timestamp=alert.timestamp,
+                subscription=alert.subscribers,
+                diff=alert.diff,
+                current_price=current_price,
+            )
+    await flush_last_alerts()
+    logger.debug(f'Delivery queue: {delivery_queue.stats()}')
 
 async def cbrf_scheduler(bot: Bot) -> None:
     """
-    Отправляет сообщения всем подписавшимся на уведомления о курсах ЦБ
+    Ставит в очередь доставки сообщения всем подписавшимся на уведомления о курсах ЦБ
     Args:
         bot: Bot
 
@@ -165,43 +248,72 @@ async def cbrf_scheduler(bot: Bot) -> None:
         None
     """
     global LAST_CBRF_ALERT
-    await EUR_CBR.update_rates()
-    await USD_CBR.update_rates()
-    if (await EUR_CBR.is_updated() or await USD_CBR.is_updated()) and is_cbrf_alert_need():
+    await cbr_rates.ensure_fresh()
+    if await cbr_rates.is_updated() and is_cbrf_alert_need():
         users = await get_cbrf_users()
-        msg = f'ЦБ РФ обновил курсы валют\n\n{await USD_CBR.get_last_rate()}\n___________________________________\n\n{await EUR_CBR.get_last_rate()}'
+        msg = f'ЦБ РФ обновил курсы валют\n\n{await cbr_rates.get_last_rates()}'
         for user in users:
-            await bot.send_message(user, msg, parse_mode=ParseMode.HTML)
+            delivery_queue.enqueue(user, msg, parse_mode=ParseMode.HTML)
         LAST_CBRF_ALERT = datetime.now(tz=timezone(timedelta(hours=config.TIME_ZONE)))
 
 async def coins_list_worker() -> None:
     """
     Обновляет локальный список криптовалют из API CoinGecko
     
-    Сравнивает локальный список с API и добавляет новые криптовалюты
+    Синхронизирует справочник (см. update_coins_list) и, если он изменился,
+    перестраивает индекс поиска по справочнику
     
     Returns:
         None
     """
-    local_coins_list = await get_coins_from_list()
-    api_coins_list = await fetch_coins_list()
-    api_coins_list = [tuple(d.values()) for d in api_coins_list]
-    diff = list(set(api_coins_list) - set(local_coins_list))
-    logger.info(f'Diff of local and api = {diff}')
-    if diff:
-        await add_coins_to_list(diff)
-        logger.info(f'Added new coins {diff} to DB')
+    if await update_coins_list():
+        await refresh_coin_search(force=True)
 
 async def clear_db() -> None:
     """
     Очищает базу данных от старых записей о ценах
     
-    Удаляет записи старше 3 дней (259200 секунд)
+    Удаляет сырые цены старше срока хранения (RAW_PRICES_RETENTION) и агрегаты
+    старше срока хранения их уровня, упаковывает завершённые дни в блоки,
+    если включено PRICE_STORAGE=columnar, затем постепенно возвращает
+    освободившееся место (vacuum_db)
     
     Returns:
         None
     """
-    await delete_old_prices(259200)
+    await delete_old_prices(RAW_PRICES_RETENTION)
+    await delete_old_rollups()
+    await compact_prices()
+    await vacuum_db()
+
+async def keep_leadership(scheduler: AsyncIOScheduler) -> None:
+    """
+    Держит блокировку лидера и включает задачи только в процессе-лидере
+    
+    Продлевает блокировку каждую треть её срока. Процесс, ставший лидером,
+    заполняет окна цен и индекс подписок заново и снимает планировщик с паузы;
+    процесс, потерявший блокировку, ставит задачи на паузу.
+    
+    Args:
+        scheduler: Планировщик задач, запущенный на паузе
+        
+    Returns:
+        None
+    """
+    while True:
+        try:
+            if await scheduler_lock.acquire():
+                if scheduler.state == STATE_PAUSED:
+                    subscription_index.invalidate()
+                    await warm_price_windows()
+                    scheduler.resume()
+            elif scheduler.state == STATE_RUNNING:
+                scheduler.pause()
+        except Exception as error:
+            logger.error(f'Leadership check failed: {error}')
+            if scheduler.state == STATE_RUNNING:
+                scheduler.pause()
+        await asyncio.sleep(scheduler_lock.ttl / 3)
 
 async def start_scheduler(bot: Bot) -> None:
     """
@@ -211,6 +323,10 @@ async def start_scheduler(bot: Bot) -> None:
     - Проверка цен каждые 60 секунд
     - Обновление списка криптовалют каждые 24 часа
     - Очистка старых данных каждый час
+    - Перезапись снимка истории цен каждые 24 часа
+    
+    Задачи выполняются, только пока процесс держит блокировку лидера,
+    поэтому при нескольких запущенных процессах активен один планировщик.
     
     Args:
         bot: Экземпляр Telegram бота
@@ -218,6 +334,7 @@ async def start_scheduler(bot: Bot) -> None:
     Returns:
         None
     """
+    global SCHEDULER, LEADERSHIP_TASK
     from database import init_db
     await init_db()
     scheduler = AsyncIOScheduler()
@@ -237,10 +354,33 @@ async def start_scheduler(bot: Bot) -> None:
         'interval',
         seconds=3600
     )
+    scheduler.add_job(
+        write_price_snapshot,
+        'interval',
+        seconds=86400
+    )
     scheduler.add_job(
         cbrf_scheduler,
         'interval',
         seconds=1800,
         args=[bot]
     )
-    scheduler.start()
+    scheduler.start(paused=True)
+    SCHEDULER = scheduler
+    LEADERSHIP_TASK = asyncio.create_task(keep_leadership(scheduler))
+
+async def stop_scheduler() -> None:
+    """
+    Останавливает планировщик задач и освобождает блокировку лидера
+    
+    Returns:
+        None
+    """
+    global SCHEDULER, LEADERSHIP_TASK
+    if LEADERSHIP_TASK is not None:
+        LEADERSHIP_TASK.cancel()
+        LEADERSHIP_TASK = None
+    if SCHEDULER is not None:
+        SCHEDULER.shutdown(wait=False)
+        SCHEDULER = None
+    await scheduler_lock.release()
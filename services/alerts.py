@@ -0,0 +1,94 @@
+"""
+Проверка порогов уведомлений об изменении цены
+"""
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from services.price_window import PriceWindow
+from services.subscription_index import BucketKey, Subscriber
+
+
+class Alert(NamedTuple):
+    """
+    Уведомление об изменении цены для группы подписчиков
+    """
+    diff: float
+    timestamp: float
+    subscribers: List[Subscriber]
+
+
+def evaluate_alerts(window: PriceWindow, buckets: Dict[BucketKey, Dict[int, float]], current_price: float, now: float) -> List[Alert]:
+    """
+    Определяет, каких подписчиков тикера нужно уведомить
+
+    Отклонение цены считается один раз на каждый интервал по окну цен,
+    порог проверяется один раз на корзину (alert_threshold, interval).
+    Пользователи перебираются только в корзинах, где порог превышен,
+    чтобы отсеять тех, у кого ещё не прошёл интервал с прошлого уведомления.
+
+    Args:
+        window: Скользящее окно цен тикера
+        buckets: Подписчики {(alert_threshold, interval): {user_id: last_alert}}
+        current_price: Текущая цена
+        now: Текущее время
+
+    Returns:
+        Список уведомлений; подписчики с одинаковым изменением цены
+        объединены в одно уведомление
+    """
+    deviations: Dict[int, Optional[Tuple[float, float]]] = {}
+    alerts: Dict[Tuple[float, float], List[Subscriber]] = {}
+    for (threshold, interval), users in buckets.items():
+        if interval not in deviations:
+            deviations[interval] = window.deviation(interval, now, current_price)
+        deviation = deviations[interval]
+        if deviation is None:
+            continue
+        change, timestamp = deviation
+        if abs(change) <= threshold / 100:
+            continue
+        due = [
+            (user_id, last_alert, threshold, interval)
+            for user_id, last_alert in users.items()
+            if now - last_alert > interval
+        ]
+        if due:
+            alerts.setdefault((round(change * 100, 2), timestamp), []).extend(due)
+    return [Alert(diff, timestamp, subscribers) for (diff, timestamp), subscribers in alerts.items()]
+
+
+class AlertLedger:
+    """
+    Накопитель отправленных уведомлений для пакетной записи в базу
+
+    Время последнего уведомления сразу обновляется в индексе подписок,
+    который до записи остаётся источником истины, а в базу все накопленные
+    отметки записываются одной транзакцией в конце тика.
+    """
+
+    def __init__(self) -> None:
+        self._pending: Dict[Tuple[int, str], float] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record(self, user_id: int, ticker: str, timestamp: float) -> None:
+        """
+        Запоминает время уведомления пользователя по тикеру
+
+        Returns:
+            None
+        """
+        self._pending[(user_id, ticker)] = timestamp
+
+    def drain(self) -> List[Tuple[float, int, str]]:
+        """
+        Забирает все накопленные отметки
+
+        Returns:
+            Список кортежей [(last_alert, user_id, ticker), ...]
+        """
+        pending, self._pending = self._pending, {}
+        return [(timestamp, user_id, ticker) for (user_id, ticker), timestamp in pending.items()]
+
+
+alert_ledger = AlertLedger()
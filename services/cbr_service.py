@@ -2,55 +2,80 @@
 Сервис для получения курсов валют ЦБРФ
 """
 import asyncio
+import logging
+import time
+import xml.etree.ElementTree as ElementTree
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 
 import cbrapi as cbr
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone, timedelta, date
 
 from config.config import config
 # from bot import TIME_ZONE
 # TIME_ZONE=7
 
+logger = logging.getLogger(__name__)
 
-async def format_date(date: datetime):
-    return date.strftime(format='%Y-%m-%d')
+# cbrapi синхронный, поэтому запросы к ЦБ выполняются в отдельном потоке,
+# чтобы не блокировать цикл событий бота; поток один, потому что общий
+# SOAP-клиент cbrapi не потокобезопасен, а запрос, не дождавшийся ответа
+# до таймаута, продолжает выполняться
+CBR_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cbr')
+
+
+def now_local() -> datetime:
+    """
+    Текущее время в часовом поясе бота
+    """
+    return datetime.now(tz=timezone(timedelta(hours=config.TIME_ZONE)))
 
 
 class CBRService:
     """
-    Класс для работы с API ЦБ РФ
+    Курсы одной валюты ЦБ РФ
+
+    Курсы хранятся как отсортированный ряд: даты в виде порядковых номеров
+    (date.toordinal()) в array('l') и курсы в array('d'). Ряд заполняет
+    CBRRateStore.refresh() через append(), новые даты дописываются в конец;
+    сравнение курсов на сегодня и завтра читает два последних значения.
     """
 
-    def __init__(self, symbol: str, period: str = 'D'):
-        self.cbr = cbr
+    # сколько последних дат держать в ряду
+    MAX_LENGTH = 62
+
+    def __init__(self, symbol: str):
         self.symbol: str = symbol
-        self.period: str = period
-        self.rates: dict = {}
+        self.dates: array = array('l')
+        self.values: array = array('d')
 
-    async def get_current_rates(self) -> dict:
-        """
-        Обновляет текущие курсы валют
-        Returns:
-            Словарь с датами и курсами валют
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def append(self, day: date, rate: float) -> None:
         """
-        result = {}
-        start_period = await self.get_start_period()
-        end_period = await self.get_end_period()
-        time_series = self.cbr.get_time_series(self.symbol, await format_date(start_period), await format_date(end_period))
+        Добавляет курс на дату в конец ряда
 
-        for date, currency in time_series.items():
-            result[f'{date}'] = f'{currency}'
-        '''for index, currency in enumerate(time_series[::-1]):
-            result[f'{format_date(self.end_period - timedelta(days=index))}'] = f'{currency}'''
+        Курс на последнюю дату ряда заменяется, более ранние даты игнорируются.
 
-        return result
+        Args:
+            day: Дата курса
+            rate: Курс в рублях
 
-    async def update_rates(self) -> None:
-        """
-        Обновляет переменную курсов валют
         Returns:
             None
         """
-        self.rates = await self.get_current_rates()
+        ordinal = day.toordinal()
+        if self.dates and ordinal <= self.dates[-1]:
+            if ordinal == self.dates[-1]:
+                self.values[-1] = rate
+            return
+        self.dates.append(ordinal)
+        self.values.append(rate)
+        if len(self.dates) > self.MAX_LENGTH:
+            del self.dates[:-self.MAX_LENGTH]
+            del self.values[:-self.MAX_LENGTH]
 
     async def get_last_rate(self) -> str:
         """
@@ -59,29 +84,13 @@ class CBRService:
             Строка с данными о курсах
         """
         if await self.is_updated():
-            today_price = float(list(self.rates.values())[-2])
-            tomorrow_price = float(list(self.rates.values())[-1])
+            today_price = self.values[-2]
+            tomorrow_price = self.values[-1]
             sign = f'✅' if tomorrow_price > today_price else f'❌'
             desc = f'Рост' if tomorrow_price > today_price else f'Падение'
             return f'❗ Курс {self.symbol} сегодня: {today_price:.2f}\n{sign} Курс {self.symbol} завтра: {tomorrow_price:.2f}\n{desc} на {abs(tomorrow_price-today_price):.2f} руб.'
         else:
-            return f'Курс {self.symbol} не изменился\nТекущий курс ЦБ РФ: {float(list(self.rates.values())[-1]):.2f}'
-
-    async def get_start_period(self) -> datetime:
-        """
-        Получает дату начального периода
-        Returns:
-            Дату начала периода
-        """
-        end_period = await self.get_end_period()
-        if self.period == 'W':
-            days = 7
-        elif self.period == 'M':
-            days = 30
-        else:
-            days = 1
-
-        return end_period - timedelta(days=days)
+            return f'Курс {self.symbol} не изменился\nТекущий курс ЦБ РФ: {self.values[-1]:.2f}'
 
     async def get_end_period(self) -> datetime:
         """
@@ -89,18 +98,163 @@ class CBRService:
         Returns:
             Дату конечного периода
         """
-        return datetime.now(tz=timezone(timedelta(hours=config.TIME_ZONE))) + timedelta(days=1)
+        return now_local() + timedelta(days=1)
 
     async def is_updated(self) -> bool:
         """
-        Проверяет, есть ли обновление курса?
+        Проверяет, есть ли обновление курса: последние два значения ряда —
+        курсы на завтра и на сегодня, и они различаются
         Returns:
             Bool
         """
-        end_period = await self.get_end_period()
+        tomorrow = (await self.get_end_period()).date().toordinal()
+        if len(self.dates) < 2 or self.dates[-1] != tomorrow or self.dates[-2] != tomorrow - 1:
+            return False
+        return self.values[-1] != self.values[-2]
+
+
+def fetch_rates_on_date(on_date: datetime) -> Dict[str, float]:
+    """
+    Получает курсы всех валют ЦБ РФ на дату одним запросом
+
+    Функция синхронная, вызывается в пуле потоков CBR_EXECUTOR
+    через fetch_rates_on_dates().
+
+    Args:
+        on_date: Дата курсов
+
+    Returns:
+        Словарь {код валюты: курс в рублях за единицу}
+    """
+    response = cbr.make_cbr_client().service.GetCursOnDate(on_date.replace(tzinfo=None))
+    rates = {}
+    for element in ElementTree.fromstring(response).iter():
+        if not element.tag.endswith('ValuteCursOnDate'):
+            continue
+        fields = {child.tag.rsplit('}', 1)[-1]: (child.text or '').strip() for child in element}
         try:
-            if self.rates[await format_date(end_period)] != self.rates[await format_date(end_period - timedelta(days=1))]:
+            rates[fields['VchCode']] = float(fields['Vcurs']) / float(fields['Vnom'])
+        except (KeyError, ValueError):
+            continue
+    return rates
+
+
+def fetch_rates_on_dates(*dates: datetime) -> List[Dict[str, float]]:
+    """
+    Получает курсы всех валют ЦБ РФ на несколько дат по очереди
+
+    SOAP-клиент cbrapi один на процесс и не потокобезопасен, поэтому
+    даты запрашиваются последовательно в одном потоке CBR_EXECUTOR.
+
+    Args:
+        dates: Даты курсов
+
+    Returns:
+        Список словарей {код валюты: курс в рублях за единицу} в порядке дат
+    """
+    return [fetch_rates_on_date(on_date) for on_date in dates]
+
+
+class CBRRateStore:
+    """
+    Общее для всего процесса хранилище курсов ЦБ РФ
+
+    Курсы всех нужных валют на сегодня и завтра загружаются двумя
+    последовательными запросами (по одному на дату) и раздаются читателям
+    из памяти. Повторная загрузка нужна, только если наступил новый день
+    или, пока ЦБ не опубликовал курс на завтра, истёк ttl.
+    """
+
+    def __init__(self, symbols: List[str], ttl: float = 1800) -> None:
+        self.symbols: List[str] = [symbol.upper() for symbol in symbols]
+        self.ttl: float = ttl
+        self.services: Dict[str, CBRService] = {symbol: CBRService(symbol) for symbol in self.symbols}
+        self._fetched_at: float = 0.0
+        self._fetched_for: Optional[date] = None
+        self._lock = asyncio.Lock()
+
+    async def is_updated(self) -> bool:
+        """
+        Проверяет, опубликовал ли ЦБ новый курс хотя бы одной валюты
+
+        Returns:
+            Bool
+        """
+        for service in self.services.values():
+            if await service.is_updated():
                 return True
-        except KeyError:
-            return False
         return False
+
+    async def is_fresh(self) -> bool:
+        """
+        Проверяет, можно ли отдавать курсы без обращения к ЦБ
+
+        Returns:
+            Bool
+        """
+        today = now_local().date()
+        if self._fetched_for != today:
+            return False
+        if await self.is_updated():
+            return True
+        return time.monotonic() - self._fetched_at < self.ttl
+
+    async def refresh(self) -> None:
+        """
+        Загружает курсы всех валют на сегодня и на завтра
+
+        Если ЦБ не ответил вовремя или запрос завершился ошибкой,
+        остаются ранее полученные курсы
+
+        Returns:
+            None
+        """
+        today = now_local()
+        end_period = today + timedelta(days=1)
+        loop = asyncio.get_running_loop()
+        try:
+            today_rates, tomorrow_rates = await asyncio.wait_for(
+                loop.run_in_executor(CBR_EXECUTOR, fetch_rates_on_dates, today, end_period),
+                timeout=config.CBR_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f'CBR request timed out after {config.CBR_TIMEOUT}s, keeping previous rates')
+            return
+        except Exception as error:
+            logger.error(f'CBR request failed, keeping previous rates: {error}')
+            return
+        for symbol, service in self.services.items():
+            if symbol not in today_rates:
+                logger.warning(f'CBR returned no rate for {symbol}')
+                continue
+            service.append(today.date(), today_rates[symbol])
+            if symbol in tomorrow_rates:
+                service.append(end_period.date(), tomorrow_rates[symbol])
+        self._fetched_at = time.monotonic()
+        self._fetched_for = today.date()
+        logger.debug(f'CBR rates refreshed for {self.symbols}')
+
+    async def ensure_fresh(self) -> None:
+        """
+        Обновляет курсы, если они устарели; одновременные вызовы ждут одного обновления
+
+        Returns:
+            None
+        """
+        async with self._lock:
+            if not await self.is_fresh():
+                await self.refresh()
+
+    async def get_last_rates(self) -> str:
+        """
+        Получает последние изменения курсов всех валют
+
+        Returns:
+            Строка с данными о курсах
+        """
+        return '\n___________________________________\n\n'.join(
+            [await service.get_last_rate() for service in self.services.values() if len(service)]
+        )
+
+
+cbr_rates = CBRRateStore(config.CBR_CURRENCIES)
@@ -0,0 +1,240 @@
+"""
+Нечёткий поиск криптовалют по справочнику coins_list
+"""
+import asyncio
+import logging
+import math
+import time
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+from database import get_coins_from_list, get_subscription_counts, get_change_version, coins_list_ready
+
+logger = logging.getLogger(__name__)
+
+# Строка справочника: (ticker, symbol, name)
+Coin = Tuple[str, str, str]
+
+
+def trigrams(text: str) -> Set[str]:
+    """
+    Разбивает строку на триграммы
+
+    Строка дополняется пробелами, чтобы начало слова давало
+    собственные триграммы и совпадение по префиксу ценилось выше.
+
+    Args:
+        text: Строка в нижнем регистре
+
+    Returns:
+        Множество триграмм
+    """
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def normalize(text: str) -> str:
+    """
+    Приводит строку к виду для разбиения на триграммы: дефисы тикеров
+    (wrapped-bitcoin) считаются пробелами, как в названиях
+
+    Args:
+        text: Строка в нижнем регистре
+
+    Returns:
+        Строка без дефисов
+    """
+    return text.replace('-', ' ')
+
+
+class CoinSearchIndex:
+    """
+    Индекс для поиска криптовалют по тикеру, символу и названию
+
+    Строится один раз по всему справочнику: для каждого поля каждой монеты
+    хранятся число триграмм и обратные списки {триграмма: номера полей}.
+    Поиск считает общие триграммы только у полей, которые встречаются
+    в обратных списках редких триграмм запроса (см. search), и ранжирует
+    монеты по сходству (коэффициент Жаккара по лучшему полю) с поправкой
+    на популярность — число подписок на монету.
+    """
+
+    # полей на монету: ticker, symbol, name
+    FIELDS = 3
+    # вес популярности относительно сходства
+    POPULARITY_WEIGHT = 0.05
+    # минимальное сходство, при котором монета попадает в результаты
+    MIN_SIMILARITY = 0.3
+
+    def __init__(self, max_age: float = 86400) -> None:
+        self.max_age: float = max_age
+        self.built_at: Optional[float] = None
+        # счётчик изменений справочника (changes 'coins_list'), по которому построен индекс
+        self.version: Optional[int] = None
+        self._coins: List[Coin] = []
+        self._popularity: array = array('d')
+        self._sizes: array = array('H')
+        self._postings: Dict[str, array] = {}
+        self._exact: Dict[str, List[int]] = {}
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._coins)
+
+    def build(self, coins: List[Coin], popularity: Optional[Dict[str, int]] = None) -> None:
+        """
+        Строит индекс заново
+
+        Args:
+            coins: Справочник [(ticker, symbol, name), ...]
+            popularity: Число подписок по тикерам {ticker: count}
+
+        Returns:
+            None
+        """
+        popularity = popularity or {}
+        started = time.perf_counter()
+        postings: Dict[str, array] = {}
+        exact: Dict[str, List[int]] = {}
+        sizes = array('H')
+        weights = array('d')
+        for number, (ticker, symbol, name) in enumerate(coins):
+            weights.append(math.log1p(popularity.get(ticker, 0)))
+            indexed: List[str] = []
+            for field in (ticker, symbol, name):
+                entry = len(sizes)
+                value = (field or '').lower()
+                words = normalize(value)
+                grams = trigrams(words)
+                sizes.append(min(len(grams), 0xFFFF))
+                # тикер CoinGecko обычно совпадает с названием; такое же поле
+                # даёт то же сходство, поэтому в обратные списки попадает один раз
+                if words in indexed:
+                    continue
+                indexed.append(words)
+                for gram in grams:
+                    posting = postings.get(gram)
+                    if posting is None:
+                        posting = postings[gram] = array('l')
+                    posting.append(entry)
+                if value:
+                    numbers = exact.setdefault(value, [])
+                    if not numbers or numbers[-1] != number:
+                        numbers.append(number)
+        self._coins = list(coins)
+        self._popularity = weights
+        self._sizes = sizes
+        self._postings = postings
+        self._exact = exact
+        self.built_at = time.monotonic()
+        logger.debug(f'Coin search index built: {len(coins)} coins, {len(postings)} trigrams in {time.perf_counter() - started:.2f}s')
+
+    def is_stale(self) -> bool:
+        """
+        Проверяет, нужно ли перестроить индекс
+
+        Returns:
+            True, если индекс не построен или старше max_age секунд
+        """
+        return self.built_at is None or time.monotonic() - self.built_at > self.max_age
+
+    async def rebuild(self, coins: List[Coin], popularity: Optional[Dict[str, int]] = None) -> None:
+        """
+        Перестраивает индекс в отдельном потоке, не блокируя цикл событий
+
+        Args:
+            coins: Справочник [(ticker, symbol, name), ...]
+            popularity: Число подписок по тикерам {ticker: count}
+
+        Returns:
+            None
+        """
+        async with self._lock:
+            await asyncio.to_thread(self.build, coins, popularity)
+
+    def exact(self, query: str) -> List[Coin]:
+        """
+        Ищет монеты, у которых тикер, символ или название совпадают с запросом
+
+        Args:
+            query: Строка поиска
+
+        Returns:
+            Список монет, самые популярные первыми
+        """
+        numbers = self._exact.get(query.strip().lower(), [])
+        numbers = sorted(numbers, key=lambda number: self._popularity[number], reverse=True)
+        return [self._coins[number] for number in numbers]
+
+    def search(self, query: str, limit: int = 5) -> List[Coin]:
+        """
+        Ищет монеты, похожие на запрос
+
+        Args:
+            query: Строка поиска
+            limit: Максимальное число результатов
+
+        Returns:
+            Список монет по убыванию релевантности
+        """
+        query_grams = trigrams(normalize(query.strip().lower()))
+        query_size = len(query_grams)
+        postings = sorted(filter(None, map(self._postings.get, query_grams)), key=len)
+        # сходство не больше shared / query_size, поэтому у подходящего поля
+        # не меньше needed общих триграмм и хотя бы одна из них — среди
+        # len(postings) - needed + 1 самых редких; по самым частым спискам
+        # (вроде '  b' или 'oin') досчитываются только найденные кандидаты
+        needed = max(1, math.ceil(self.MIN_SIMILARITY * query_size - 1e-9))
+        rare = len(postings) - needed + 1
+        if rare <= 0:
+            return []
+        common = Counter()
+        for posting in postings[:rare]:
+            common.update(posting)
+        candidates = set(common)
+        for posting in postings[rare:]:
+            common.update(candidates.intersection(posting))
+        best: Dict[int, float] = {}
+        sizes = self._sizes
+        for entry, shared in common.items():
+            if shared < needed:
+                continue
+            similarity = shared / (query_size + sizes[entry] - shared)
+            if similarity < self.MIN_SIMILARITY:
+                continue
+            number = entry // self.FIELDS
+            if similarity > best.get(number, 0.0):
+                best[number] = similarity
+        # при равной оценке порядок справочника, чтобы результат не зависел от порядка подсчёта
+        ranked = sorted(
+            best,
+            key=lambda number: (-best[number] - self.POPULARITY_WEIGHT * self._popularity[number], number),
+        )
+        return [self._coins[number] for number in ranked[:limit]]
+
+
+coin_search = CoinSearchIndex()
+
+
+async def refresh_coin_search(force: bool = False) -> None:
+    """
+    Перестраивает индекс поиска по справочнику из базы данных
+
+    Индекс перестраивается, если он старше max_age или справочник изменился
+    после его построения — в том числе в другом процессе, например
+    coins_list_worker планировщика. Пока справочник не загружен, индекс
+    не строится.
+
+    Args:
+        force: Перестроить, даже если индекс ещё не устарел
+
+    Returns:
+        None
+    """
+    if not coins_list_ready.is_set():
+        return
+    version = await get_change_version('coins_list')
+    if force or coin_search.is_stale() or coin_search.version != version:
+        await coin_search.rebuild(await get_coins_from_list(), await get_subscription_counts())
+        coin_search.version = version
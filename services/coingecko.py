@@ -1,41 +1,266 @@
+import asyncio
+import hashlib
+import logging
+import tempfile
 import aiohttp
-from typing import Dict, List, Any
+from typing import BinaryIO, Dict, List, Any, Optional, Tuple
+
+from services.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class CoinGeckoClient:
+    """
+    Клиент API CoinGecko
+
+    Держит одну aiohttp-сессию с keep-alive и ограничением числа соединений
+    на всё время работы бота. Одинаковые запросы, выполняющиеся одновременно,
+    объединяются: второй и последующие вызовы ждут ответа первого.
+    Все запросы расходуют общий бюджет запросов к API (token bucket).
+    """
+
+    BASE_URL = "https://api.coingecko.com/api/v3"
+    # ограничения на один запрос цен, чтобы URL не рос бесконечно
+    MAX_IDS_PER_REQUEST = 250
+    MAX_IDS_LENGTH = 2000
+    # размер части ответа при потоковом чтении
+    CHUNK_SIZE = 65536
+    # ответы больше этого размера при скачивании сбрасываются на диск
+    SPOOL_SIZE = 1048576
+
+    def __init__(self, base_url: str = BASE_URL, connections: int = 10, timeout: float = 30,
+                 parallel: int = 4, rate: float = 0.5, burst: float = 10) -> None:
+        self.base_url: str = base_url
+        self.connections: int = connections
+        self.timeout: float = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._inflight: Dict[Tuple[str, Tuple], asyncio.Future] = {}
+        self._parallel = asyncio.Semaphore(parallel)
+        self._budget = TokenBucket(rate=rate, capacity=burst)
+
+    async def start(self) -> None:
+        """
+        Открывает HTTP-сессию, если она ещё не открыта
+
+        Returns:
+            None
+        """
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(limit=self.connections, keepalive_timeout=60, ttl_dns_cache=300)
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    async def close(self) -> None:
+        """
+        Закрывает HTTP-сессию
+
+        Returns:
+            None
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, path: str, params: Optional[Dict[str, str]]) -> Any:
+        """
+        Выполняет GET-запрос к API
+
+        Args:
+            path: Путь метода API
+            params: Параметры запроса
+
+        Returns:
+            Разобранный JSON-ответ
+
+        Raises:
+            aiohttp.ClientResponseError: Если API вернул код ошибки
+        """
+        await self.start()
+        await self._budget.acquire()
+        async with self._session.get(f'{self.base_url}{path}', params=params) as resp:
+            self._check_status(resp)
+            return await resp.json()
+
+    def _check_status(self, resp: aiohttp.ClientResponse) -> None:
+        """
+        Проверяет код ответа; при 429 приостанавливает бюджет запросов
+
+        Args:
+            resp: Ответ API
+
+        Raises:
+            aiohttp.ClientResponseError: Если API вернул код ошибки
+        """
+        if resp.status == 429:
+            retry_after = resp.headers.get('Retry-After', '')
+            self._budget.pause(float(retry_after) if retry_after.isdigit() else 60)
+        resp.raise_for_status()
+
+    async def download(self, path: str, params: Optional[Dict[str, str]] = None) -> Tuple[BinaryIO, str]:
+        """
+        Скачивает тело ответа по частям во временный файл, одновременно считая его хеш
+
+        Хеш позволяет понять, что ответ не изменился, не разбирая JSON.
+        В памяти держится не больше SPOOL_SIZE байт ответа, остальное
+        записывается на диск; файл закрывает вызывающий код.
+
+        Args:
+            path: Путь метода API
+            params: Параметры запроса
+
+        Returns:
+            Кортеж (файл с телом ответа, открытый с начала; sha256 тела в hex)
+
+        Raises:
+            aiohttp.ClientError: При ошибке HTTP-запроса
+        """
+        await self.start()
+        await self._budget.acquire()
+        digest = hashlib.sha256()
+        body = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_SIZE)
+        try:
+            async with self._session.get(f'{self.base_url}{path}', params=params) as resp:
+                self._check_status(resp)
+                async for chunk in resp.content.iter_chunked(self.CHUNK_SIZE):
+                    digest.update(chunk)
+                    body.write(chunk)
+        except BaseException:
+            body.close()
+            raise
+        body.seek(0)
+        return body, digest.hexdigest()
+
+    async def get_json(self, path: str, params: Optional[Dict[str, str]] = None) -> Any:
+        """
+        Выполняет GET-запрос, объединяя его с таким же уже выполняющимся
+
+        Args:
+            path: Путь метода API
+            params: Параметры запроса
+
+        Returns:
+            Разобранный JSON-ответ
+
+        Raises:
+            aiohttp.ClientError: При ошибке HTTP-запроса
+        """
+        key = (path, tuple(sorted((params or {}).items())))
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._request(path, params))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            logger.debug(f'Joined in-flight request {path}')
+        return await asyncio.shield(task)
+
+    def split_ids(self, tickers: List[str]) -> List[List[str]]:
+        """
+        Разбивает идентификаторы на части, ограниченные по количеству и длине
+
+        Args:
+            tickers: Список идентификаторов криптовалют
+
+        Returns:
+            Список частей
+        """
+        chunks: List[List[str]] = []
+        chunk: List[str] = []
+        length = 0
+        for ticker in sorted(set(tickers)):
+            if chunk and (len(chunk) >= self.MAX_IDS_PER_REQUEST or length + len(ticker) + 1 > self.MAX_IDS_LENGTH):
+                chunks.append(chunk)
+                chunk, length = [], 0
+            chunk.append(ticker)
+            length += len(ticker) + 1
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    async def _fetch_prices_chunk(self, tickers: List[str]) -> Dict[str, Dict[str, float]]:
+        """
+        Получает цены одной части идентификаторов
+
+        Ошибка запроса не прерывает получение остальных частей:
+        она логируется, а для этой части возвращается пустой результат.
+
+        Args:
+            tickers: Часть идентификаторов криптовалют
+
+        Returns:
+            Словарь с ценами в формате {ticker: {"usd": price}}
+        """
+        params = {
+            "ids": ",".join(tickers),
+            "vs_currencies": "usd"
+        }
+        async with self._parallel:
+            try:
+                return await self.get_json('/simple/price', params)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                logger.warning(f'Failed to fetch prices for {len(tickers)} tickers ({tickers[0]}..{tickers[-1]}): {getattr(error, "status", error)}')
+                return {}
+
+    async def fetch_prices(self, tickers: List[str]) -> Dict[str, Dict[str, float]]:
+        """
+        Получает текущие цены криптовалют
+
+        Идентификаторы разбиваются на части, которые запрашиваются параллельно
+        (не больше parallel одновременно), результаты объединяются.
+
+        Args:
+            tickers: Список идентификаторов криптовалют для получения цен
+
+        Returns:
+            Словарь с ценами в формате {ticker: {"usd": price}}; тикеров
+            из частей, которые не удалось получить, в нём нет
+        """
+        prices: Dict[str, Dict[str, float]] = {}
+        chunks = self.split_ids(tickers)
+        for result in await asyncio.gather(*(self._fetch_prices_chunk(chunk) for chunk in chunks)):
+            prices.update(result)
+        return prices
+
+    async def download_coins_list(self) -> Tuple[BinaryIO, str]:
+        """
+        Скачивает полный список криптовалют без разбора JSON
+
+        Returns:
+            Кортеж (файл с JSON-массивом вида [{"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"}, ...],
+            sha256 тела в hex)
+        """
+        return await self.download('/coins/list')
+
+
+coingecko = CoinGeckoClient()
+
 
 async def fetch_prices(tickers: List[str]) -> Dict[str, Dict[str, float]]:
     """
     Получает текущие цены криптовалют через API CoinGecko
-    
+
     Args:
         tickers: Список идентификаторов криптовалют для получения цен
-        
+
     Returns:
         Словарь с ценами в формате {ticker: {"usd": price}}
-        
-    Raises:
-        aiohttp.ClientError: При ошибке HTTP-запроса
     """
-    url = "https://api.coingecko.com/api/v3/simple/price"
-    params = {
-        "ids": ",".join(tickers),
-        "vs_currencies": "usd"
-    }
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, params=params) as resp:
-            return await resp.json()
+    return await coingecko.fetch_prices(tickers)
 
 
-async def fetch_coins_list() -> List[Dict[str, str]]:
+async def download_coins_list() -> Tuple[BinaryIO, str]:
     """
-    Получает полный список всех доступных криптовалют через API CoinGecko
-    
+    Скачивает полный список криптовалют через API CoinGecko без разбора JSON
+
     Returns:
-        Список словарей с информацией о криптовалютах в формате:
-        [{"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"}, ...]
-        
+        Кортеж (файл с JSON-массивом
+        [{"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"}, ...], sha256 тела в hex)
+
     Raises:
         aiohttp.ClientError: При ошибке HTTP-запроса
     """
-    url = "https://api.coingecko.com/api/v3/coins/list"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            return await resp.json()
\ No newline at end of file
+    return await coingecko.download_coins_list()
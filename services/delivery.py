@@ -0,0 +1,200 @@
+"""
+Очередь доставки сообщений в Telegram
+"""
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramAPIError, TelegramNetworkError
+
+from services.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+OnDelivered = Callable[[], None]
+
+
+class Delivery(NamedTuple):
+    """
+    Сообщение в очереди на отправку
+    """
+    chat_id: int
+    text: str
+    parse_mode: Optional[str]
+    on_delivered: Optional[OnDelivered]
+    enqueued_at: float
+    attempt: int = 0
+
+
+class DeliveryQueue:
+    """
+    Очередь отправки сообщений с пулом асинхронных воркеров
+
+    Соблюдает лимиты Telegram: общий (около 30 сообщений в секунду) через
+    token bucket и не чаще одного сообщения в секунду в один чат. При ответе
+    RetryAfter приостанавливает отправку на указанное время и повторяет
+    сообщение, пользователей, заблокировавших бота, пропускает.
+    """
+
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, workers: int = 8, rate: float = 30, chat_interval: float = 1.0) -> None:
+        self.workers_count: int = workers
+        self.chat_interval: float = chat_interval
+        self._bucket = TokenBucket(rate=rate, capacity=rate)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+        self._chat_slots: Dict[int, float] = {}
+        self._bot: Optional[Bot] = None
+        self.delivered: int = 0
+        self.failed: int = 0
+        self.last_latency: float = 0.0
+        self.max_latency: float = 0.0
+
+    @property
+    def depth(self) -> int:
+        """
+        Количество сообщений, ожидающих отправки
+        """
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Получает метрики очереди
+
+        Returns:
+            Словарь с глубиной очереди, счётчиками и задержкой доставки в секундах
+        """
+        return {
+            'depth': self.depth,
+            'delivered': self.delivered,
+            'failed': self.failed,
+            'last_latency': round(self.last_latency, 3),
+            'max_latency': round(self.max_latency, 3),
+        }
+
+    def start(self, bot: Bot) -> None:
+        """
+        Запускает воркеры очереди
+
+        Args:
+            bot: Экземпляр Telegram бота, через который отправляются сообщения
+
+        Returns:
+            None
+        """
+        if self._workers:
+            return
+        self._bot = bot
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers_count)]
+        logger.debug(f'Delivery queue started with {self.workers_count} workers')
+
+    async def stop(self, timeout: float = 10) -> None:
+        """
+        Дожидается отправки оставшихся сообщений и останавливает воркеры
+
+        Args:
+            timeout: Сколько секунд ждать опустошения очереди
+
+        Returns:
+            None
+        """
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f'Delivery queue stopped with {self.depth} undelivered messages')
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info(f'Delivery queue stopped: {self.stats()}')
+
+    def enqueue(self, chat_id: int, text: str, parse_mode: Optional[str] = None, on_delivered: Optional[OnDelivered] = None) -> None:
+        """
+        Ставит сообщение в очередь на отправку
+
+        Args:
+            chat_id: Идентификатор чата
+            text: Текст сообщения
+            parse_mode: Режим разметки сообщения
+            on_delivered: Функция, вызываемая после успешной отправки
+
+        Returns:
+            None
+        """
+        self._queue.put_nowait(Delivery(chat_id, text, parse_mode, on_delivered, time.monotonic()))
+
+    async def _wait_chat_slot(self, chat_id: int) -> None:
+        """
+        Резервирует ближайшее время отправки в чат и дожидается его
+        """
+        now = time.monotonic()
+        slot = max(now, self._chat_slots.get(chat_id, 0.0))
+        self._chat_slots[chat_id] = slot + self.chat_interval
+        if len(self._chat_slots) > 10000:
+            self._chat_slots = {chat: until for chat, until in self._chat_slots.items() if until > now}
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _worker(self) -> None:
+        """
+        Забирает сообщения из очереди и отправляет их
+        """
+        while True:
+            delivery: Delivery = await self._queue.get()
+            try:
+                await self._deliver(delivery)
+            except Exception as error:
+                self.failed += 1
+                logger.exception(f'Unexpected delivery error for {delivery.chat_id}: {error}')
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, delivery: Delivery) -> None:
+        """
+        Отправляет одно сообщение с учётом лимитов
+        """
+        await self._wait_chat_slot(delivery.chat_id)
+        await self._bucket.acquire()
+        try:
+            await self._bot.send_message(delivery.chat_id, delivery.text, parse_mode=delivery.parse_mode)
+        except TelegramRetryAfter as error:
+            logger.warning(f'Telegram flood control, retry after {error.retry_after}s')
+            self._bucket.pause(error.retry_after)
+            self._retry(delivery)
+            return
+        except TelegramForbiddenError:
+            self.failed += 1
+            logger.info(f'User {delivery.chat_id} blocked the bot, message skipped')
+            return
+        except TelegramBadRequest as error:
+            self.failed += 1
+            logger.error(f'Message to {delivery.chat_id} rejected: {error}')
+            return
+        except (TelegramNetworkError, TelegramAPIError) as error:
+            logger.warning(f'Failed to send message to {delivery.chat_id}: {error}')
+            self._retry(delivery)
+            return
+        latency = time.monotonic() - delivery.enqueued_at
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self.delivered += 1
+        if delivery.on_delivered is not None:
+            delivery.on_delivered()
+
+    def _retry(self, delivery: Delivery) -> None:
+        """
+        Возвращает сообщение в очередь, если не исчерпаны попытки
+        """
+        if delivery.attempt + 1 >= self.MAX_ATTEMPTS:
+            self.failed += 1
+            logger.error(f'Message to {delivery.chat_id} dropped after {self.MAX_ATTEMPTS} attempts')
+            return
+        self._queue.put_nowait(delivery._replace(attempt=delivery.attempt + 1))
+
+
+delivery_queue = DeliveryQueue()
@@ -0,0 +1,111 @@
+"""
+Потоковый разбор больших JSON-массивов
+"""
+import codecs
+import json
+import re
+from typing import Any, BinaryIO, Iterator, List
+
+# пробельные символы между элементами JSON
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class JSONArrayParser:
+    """
+    Инкрементальный разборщик JSON-массива верхнего уровня
+
+    Принимает ответ частями произвольного размера и возвращает элементы
+    массива по мере того, как они становятся полными. В памяти держится
+    только недоразобранный хвост, а не весь ответ и не весь список объектов.
+    """
+
+    def __init__(self) -> None:
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._buffer: str = ''
+        # ожидаемый токен: '[' в начале, значение, ',' или ']' после значения
+        self._state: str = 'start'
+
+    @property
+    def finished(self) -> bool:
+        return self._state == 'done'
+
+    def feed(self, data: bytes, final: bool = False) -> List[Any]:
+        """
+        Добавляет очередную часть ответа
+
+        Args:
+            data: Часть ответа в UTF-8
+            final: Это последняя часть
+
+        Returns:
+            Элементы массива, ставшие полными после этой части
+
+        Raises:
+            ValueError: Если ответ не является JSON-массивом
+        """
+        buffer = self._buffer + self._text.decode(data, final)
+        items: List[Any] = []
+        pos = 0
+        end = len(buffer)
+        while True:
+            pos = WHITESPACE.match(buffer, pos).end()
+            if pos >= end:
+                break
+            char = buffer[pos]
+            if self._state == 'start':
+                if char != '[':
+                    raise ValueError(f'Expected JSON array, got {char!r}')
+                self._state = 'first'
+                pos += 1
+            elif self._state == 'separator' or (self._state == 'first' and char == ']'):
+                if char == ']':
+                    self._state = 'done'
+                    pos += 1
+                elif char == ',' and self._state == 'separator':
+                    self._state = 'value'
+                    pos += 1
+                else:
+                    raise ValueError(f'Unexpected {char!r} at offset {pos}')
+            elif self._state == 'done':
+                raise ValueError(f'Unexpected data after JSON array')
+            else:
+                try:
+                    item, item_end = self._decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if final:
+                        raise ValueError(f'Malformed JSON array element at offset {pos}')
+                    break
+                # число или литерал, за которым ещё нет ',' или ']', может
+                # продолжиться в следующей части ("-0." + "5")
+                if not final and not isinstance(item, (dict, list, str)):
+                    after = WHITESPACE.match(buffer, item_end).end()
+                    if after >= end or buffer[after] not in ',]':
+                        break
+                items.append(item)
+                self._state = 'separator'
+                pos = item_end
+        self._buffer = buffer[pos:]
+        if final and not self.finished:
+            raise ValueError(f'Unexpected end of JSON array')
+        return items
+
+
+def iter_json_array(stream: BinaryIO, chunk_size: int = 65536) -> Iterator[Any]:
+    """
+    Читает JSON-массив из файла частями и отдаёт его элементы по одному
+
+    Args:
+        stream: Файл, открытый в двоичном режиме
+        chunk_size: Размер читаемой части в байтах
+
+    Returns:
+        Итератор элементов массива
+
+    Raises:
+        ValueError: Если содержимое не является JSON-массивом
+    """
+    parser = JSONArrayParser()
+    while chunk := stream.read(chunk_size):
+        yield from parser.feed(chunk)
+    yield from parser.feed(b'', final=True)
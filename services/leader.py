@@ -0,0 +1,57 @@
+"""
+Выбор единственного активного процесса через блокировку в базе данных
+"""
+import logging
+import os
+import socket
+import uuid
+
+from database import try_acquire_lock, release_lock
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLock:
+    """
+    Блокировка лидера с истекающим сроком действия
+
+    Процесс, захвативший блокировку, должен продлевать её чаще, чем раз в ttl
+    секунд. Если лидер завис или упал, блокировка истекает и её захватывает
+    другой процесс.
+    """
+
+    def __init__(self, name: str, ttl: float = 30) -> None:
+        self.name: str = name
+        self.ttl: float = ttl
+        self.owner: str = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.is_leader: bool = False
+
+    async def acquire(self) -> bool:
+        """
+        Захватывает или продлевает блокировку
+
+        Returns:
+            True, если процесс является лидером
+        """
+        was_leader = self.is_leader
+        self.is_leader = await try_acquire_lock(self.name, self.owner, self.ttl)
+        if self.is_leader and not was_leader:
+            logger.info(f'Acquired {self.name} leadership as {self.owner}')
+        elif was_leader and not self.is_leader:
+            logger.warning(f'Lost {self.name} leadership')
+        return self.is_leader
+
+    async def release(self) -> None:
+        """
+        Освобождает блокировку, если процесс является лидером
+
+        Returns:
+            None
+        """
+        if self.is_leader:
+            await release_lock(self.name, self.owner)
+            self.is_leader = False
+            logger.info(f'Released {self.name} leadership')
+
+
+scheduler_lock = LeaderLock('scheduler')
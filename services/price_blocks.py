@@ -0,0 +1,76 @@
+"""
+Упаковка истории цен в компактные блоки
+"""
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterator, List, Tuple
+
+# сколько выборок одного тикера хранится в одном блоке (сутки минутных цен)
+BLOCK_SIZE = 1440
+
+# Блок: (начало, конец, число выборок, смещения времени, цены)
+Block = Tuple[int, int, int, bytes, bytes]
+
+
+def _pack(values: array) -> bytes:
+    """
+    Сериализует массив в little-endian независимо от платформы
+    """
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack(typecode: str, blob: bytes) -> array:
+    """
+    Восстанавливает массив, сериализованный _pack
+    """
+    values = array(typecode)
+    values.frombytes(blob)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def encode_blocks(samples: List[Tuple[int, float]]) -> Iterator[Block]:
+    """
+    Упаковывает выборки одного тикера в блоки по BLOCK_SIZE
+
+    Время хранится как смещения в секундах от начала блока (uint32),
+    цены — как float64, каждая колонка одним BLOB.
+
+    Args:
+        samples: Выборки [(timestamp, price), ...] по возрастанию времени
+
+    Returns:
+        Итератор блоков (начало, конец, число выборок, смещения, цены)
+    """
+    for first in range(0, len(samples), BLOCK_SIZE):
+        chunk = samples[first:first + BLOCK_SIZE]
+        start = int(chunk[0][0])
+        offsets = array('I', (int(timestamp) - start for timestamp, _ in chunk))
+        prices = array('d', (price for _, price in chunk))
+        yield start, int(chunk[-1][0]), len(chunk), _pack(offsets), _pack(prices)
+
+
+def decode_block(start: int, offsets: bytes, prices: bytes, since: float, until: float) -> Tuple[List[int], array]:
+    """
+    Распаковывает выборки блока, попадающие в период
+
+    Args:
+        start: Начало блока
+        offsets: Смещения времени от начала блока
+        prices: Цены
+        since: Начало периода
+        until: Конец периода
+
+    Returns:
+        Кортеж (времена, цены) по возрастанию времени
+    """
+    offsets = _unpack('I', offsets)
+    prices = _unpack('d', prices)
+    low = bisect_left(offsets, since - start)
+    high = bisect_right(offsets, until - start)
+    return [start + offset for offset in offsets[low:high]], prices[low:high]
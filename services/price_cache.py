@@ -0,0 +1,111 @@
+"""
+Кэш последних цен криптовалют
+"""
+import logging
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from database import get_latest_prices
+from services.coingecko import fetch_prices
+
+logger = logging.getLogger(__name__)
+
+
+class PriceCache:
+    """
+    Последние известные цены по тикерам с временем получения
+
+    Планировщик записывает сюда цены на каждом тике, обработчики читают.
+    Для тикеров, цена которых устарела больше чем на ttl, сначала берётся
+    последняя цена из агрегатов в базе: их пишет планировщик, в том числе
+    из другого процесса, когда этот запущен с BOT_ROLE=bot. В API кэш идёт,
+    только если устарела и она.
+    """
+
+    def __init__(self, ttl: float = 120) -> None:
+        self.ttl: float = ttl
+        self._entries: Dict[str, Tuple[float, float]] = {}
+
+    def update(self, prices: Dict[str, Dict[str, float]], timestamp: Optional[float] = None) -> None:
+        """
+        Сохраняет цены, полученные от API
+
+        Args:
+            prices: Словарь с ценами в формате {ticker: {"usd": price}}
+            timestamp: Время получения цен, по умолчанию текущее
+
+        Returns:
+            None
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        for ticker, quote in prices.items():
+            usd = quote.get('usd') if isinstance(quote, dict) else None
+            if usd is not None:
+                self.put(ticker, usd, timestamp)
+
+    def put(self, ticker: str, price: float, timestamp: float) -> None:
+        """
+        Сохраняет цену тикера, если она не старше уже сохранённой
+
+        Args:
+            ticker: Тикер криптовалюты
+            price: Цена
+            timestamp: Время цены
+
+        Returns:
+            None
+        """
+        entry = self._entries.get(ticker)
+        if entry is None or entry[1] <= timestamp:
+            self._entries[ticker] = (price, timestamp)
+
+    def get(self, ticker: str) -> Optional[float]:
+        """
+        Получает свежую цену тикера
+
+        Args:
+            ticker: Тикер криптовалюты
+
+        Returns:
+            Цена или None, если её нет в кэше или она устарела
+        """
+        entry = self._entries.get(ticker)
+        if entry is None or time.time() - entry[1] > self.ttl:
+            return None
+        return entry[0]
+
+    async def get_or_fetch(self, tickers: Iterable[str]) -> Dict[str, float]:
+        """
+        Получает цены тикеров, запрашивая в API только те, свежей цены
+        которых нет ни в кэше, ни в агрегатах в базе
+
+        Args:
+            tickers: Тикеры криптовалют
+
+        Returns:
+            Словарь {ticker: price}; тикеров, цену которых получить не удалось, в нём нет
+        """
+        result: Dict[str, float] = {}
+        missing = []
+        for ticker in tickers:
+            price = self.get(ticker)
+            if price is None:
+                missing.append(ticker)
+            else:
+                result[ticker] = price
+        if missing:
+            for ticker, (price, timestamp) in (await get_latest_prices(missing, time.time() - self.ttl)).items():
+                self.put(ticker, price, timestamp)
+                result[ticker] = price
+            missing = [ticker for ticker in missing if ticker not in result]
+        if missing:
+            logger.debug(f'Price cache miss for {missing}')
+            self.update(await fetch_prices(missing))
+            for ticker in missing:
+                price = self.get(ticker)
+                if price is not None:
+                    result[ticker] = price
+        return result
+
+
+price_cache = PriceCache()
@@ -0,0 +1,240 @@
+"""
+Снимок истории цен в файлах, которые читаются через mmap без копирования
+"""
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import sys
+from bisect import bisect_left
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    import numpy
+except ImportError:  # numpy необязателен, без него используются memoryview
+    numpy = None
+
+from config.config import config
+
+logger = logging.getLogger(__name__)
+
+# заголовок файла: сигнатура, версия формата, резерв
+HEADER = struct.Struct('<4sI8x')
+MAGIC = b'CWPS'
+VERSION = 1
+# запись: время и цена, float64 каждое
+RECORD = struct.Struct('<dd')
+
+
+def _group(prices: Iterable[Tuple[str, float, int]]) -> Dict[str, List[Tuple[float, float]]]:
+    """
+    Группирует записи (ticker, price, timestamp) по тикерам в выборки (timestamp, price)
+    """
+    by_ticker: Dict[str, List[Tuple[float, float]]] = {}
+    for ticker, price, timestamp in prices:
+        by_ticker.setdefault(ticker, []).append((timestamp, price))
+    return by_ticker
+
+
+class SeriesView(NamedTuple):
+    """
+    История одного тикера поверх отображённого в память файла
+
+    timestamps и prices — представления без копирования (memoryview с шагом 2
+    или массивы numpy, если он установлен) по возрастанию времени.
+    """
+    timestamps: Sequence[float]
+    prices: Sequence[float]
+
+    def since(self, timestamp: float) -> 'SeriesView':
+        """
+        Отрезает выборки раньше timestamp, тоже без копирования
+        """
+        first = bisect_left(self.timestamps, timestamp)
+        return SeriesView(self.timestamps[first:], self.prices[first:])
+
+
+class PriceSnapshot:
+    """
+    Снимок истории цен: по файлу на тикер из записей фиксированной длины
+
+    Файл — заголовок HEADER и записи RECORD (время, цена) по возрастанию
+    времени. Новые цены дописываются в конец, раз в сутки снимок целиком
+    перезаписывается из базы с обрезкой по сроку хранения. Чтение отображает
+    файл в память и отдаёт колонки как представления без копирования.
+    На платформах с порядком байт big-endian снимок не используется.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory: str = directory
+        self.enabled: bool = bool(directory) and sys.byteorder == 'little'
+        # снимок перезаписывается и дописывается только под этой блокировкой
+        self.lock = asyncio.Lock()
+        self._maps: List[mmap.mmap] = []
+
+    def path(self, ticker: str) -> str:
+        return os.path.join(self.directory, f'{ticker}.bin')
+
+    def tickers(self) -> List[str]:
+        """
+        Получает тикеры, для которых есть файлы снимка
+
+        Returns:
+            Список тикеров
+        """
+        if not self.enabled or not os.path.isdir(self.directory):
+            return []
+        return [name[:-4] for name in os.listdir(self.directory) if name.endswith('.bin')]
+
+    def _append_file(self, path: str, samples: List[Tuple[float, float]]) -> None:
+        """
+        Дописывает выборки в файл тикера
+
+        Недописанная при сбое запись обрезается, выборки не новее последней
+        записи файла пропускаются, файл с чужим заголовком создаётся заново.
+        """
+        try:
+            file = open(path, 'r+b')
+        except FileNotFoundError:
+            file = open(path, 'w+b')
+        with file:
+            size = os.fstat(file.fileno()).st_size
+            header = file.read(HEADER.size)
+            if len(header) < HEADER.size or HEADER.unpack(header) != (MAGIC, VERSION):
+                file.seek(0)
+                file.truncate()
+                file.write(HEADER.pack(MAGIC, VERSION))
+                size = HEADER.size
+            records = (size - HEADER.size) // RECORD.size
+            end = HEADER.size + records * RECORD.size
+            if records:
+                file.seek(end - RECORD.size)
+                last, _ = RECORD.unpack(file.read(RECORD.size))
+                samples = [sample for sample in samples if sample[0] > last]
+            file.truncate(end)
+            file.seek(end)
+            file.write(b''.join(RECORD.pack(timestamp, price) for timestamp, price in samples))
+
+    def append(self, prices: Iterable[Tuple[str, float, int]]) -> None:
+        """
+        Дописывает новые цены в файлы тикеров
+
+        Функция синхронная, вызывается в отдельном потоке под блокировкой lock.
+
+        Args:
+            prices: Записи [(ticker, price, timestamp), ...] по возрастанию времени
+
+        Returns:
+            None
+        """
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for ticker, samples in _group(prices).items():
+            self._append_file(self.path(ticker), samples)
+
+    def rewrite(self, prices: Iterable[Tuple[str, float, int]]) -> None:
+        """
+        Перезаписывает снимок целиком
+
+        Файлы пишутся во временные и атомарно заменяют старые; файлы
+        тикеров, которых нет в истории, удаляются. Функция синхронная,
+        вызывается в отдельном потоке под блокировкой lock.
+
+        Args:
+            prices: Записи [(ticker, price, timestamp), ...] по возрастанию времени
+
+        Returns:
+            None
+        """
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        by_ticker = _group(prices)
+        for ticker, samples in by_ticker.items():
+            with open(f'{self.path(ticker)}.tmp', 'wb') as file:
+                file.write(HEADER.pack(MAGIC, VERSION))
+                file.write(b''.join(RECORD.pack(timestamp, price) for timestamp, price in samples))
+            os.replace(f'{self.path(ticker)}.tmp', self.path(ticker))
+        for ticker in set(self.tickers()) - set(by_ticker):
+            os.remove(self.path(ticker))
+        logger.info(f'Price snapshot rewritten: {len(by_ticker)} tickers')
+
+    def open(self, ticker: str) -> Optional[SeriesView]:
+        """
+        Отображает файл тикера в память
+
+        Представления остаются действительными до close().
+
+        Args:
+            ticker: Тикер криптовалюты
+
+        Returns:
+            SeriesView или None, если файла нет или он повреждён
+        """
+        if not self.enabled:
+            return None
+        try:
+            with open(self.path(ticker), 'rb') as file:
+                size = os.fstat(file.fileno()).st_size
+                if size < HEADER.size + RECORD.size:
+                    return None
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except OSError:
+            return None
+        magic, version = HEADER.unpack_from(mapped)
+        if magic != MAGIC or version != VERSION:
+            mapped.close()
+            logger.warning(f'Unknown price snapshot format in {self.path(ticker)}')
+            return None
+        self._maps.append(mapped)
+        # недописанная последняя запись отбрасывается
+        records = (size - HEADER.size) // RECORD.size
+        if numpy is not None:
+            table = numpy.frombuffer(mapped, dtype='<f8', count=records * 2, offset=HEADER.size).reshape(records, 2)
+            return SeriesView(table[:, 0], table[:, 1])
+        values = memoryview(mapped)[HEADER.size:HEADER.size + records * RECORD.size].cast('d')
+        return SeriesView(values[0::2], values[1::2])
+
+    def read(self, since: float) -> Tuple[Dict[str, SeriesView], Optional[float]]:
+        """
+        Отображает снимок всех тикеров начиная с момента since
+
+        Args:
+            since: Начало периода
+
+        Returns:
+            Кортеж ({ticker: SeriesView}, время, до которого снимок полон по
+            всем тикерам, или None, если снимок пуст)
+        """
+        series: Dict[str, SeriesView] = {}
+        covered: Optional[float] = None
+        for ticker in self.tickers():
+            view = self.open(ticker)
+            if view is None:
+                continue
+            last = view.timestamps[-1]
+            if last < since:
+                continue
+            series[ticker] = view.since(since)
+            covered = last if covered is None else min(covered, last)
+        return series, covered
+
+    def close(self) -> None:
+        """
+        Освобождает все отображения файлов, открытые через open()
+
+        Returns:
+            None
+        """
+        for mapped in self._maps:
+            try:
+                mapped.close()
+            except BufferError:
+                # на отображение ещё ссылается представление, его закроет сборщик мусора
+                pass
+        self._maps.clear()
+
+
+price_snapshot = PriceSnapshot(config.PRICE_SNAPSHOT_DIR)
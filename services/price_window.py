@@ -0,0 +1,245 @@
+"""
+Скользящие окна последних цен криптовалют в памяти
+"""
+import logging
+from array import array
+from collections import deque
+from typing import Deque, Dict, Iterable, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (timestamp, price)
+Sample = Tuple[float, float]
+
+
+class WindowExtremes:
+    """
+    Минимум и максимум цены за скользящий интервал
+
+    Хранит две монотонные очереди: добавление и вытеснение устаревших
+    значений стоят амортизированно O(1), минимум и максимум читаются за O(1).
+    """
+
+    def __init__(self, interval: int) -> None:
+        self.interval: int = interval
+        self._min: Deque[Sample] = deque()
+        self._max: Deque[Sample] = deque()
+
+    def push(self, timestamp: float, price: float) -> None:
+        """
+        Добавляет новое значение цены
+
+        Returns:
+            None
+        """
+        while self._min and self._min[-1][1] >= price:
+            self._min.pop()
+        self._min.append((timestamp, price))
+        while self._max and self._max[-1][1] <= price:
+            self._max.pop()
+        self._max.append((timestamp, price))
+
+    def evict(self, now: float) -> None:
+        """
+        Вытесняет значения старше интервала
+
+        Returns:
+            None
+        """
+        cutoff = now - self.interval
+        while self._min and self._min[0][0] < cutoff:
+            self._min.popleft()
+        while self._max and self._max[0][0] < cutoff:
+            self._max.popleft()
+
+    def min(self) -> Optional[Sample]:
+        return self._min[0] if self._min else None
+
+    def max(self) -> Optional[Sample]:
+        return self._max[0] if self._max else None
+
+
+class PriceWindow:
+    """
+    Кольцевой буфер последних цен одного тикера
+
+    Метки времени и цены лежат в двух массивах array('d') фиксированного
+    размера; при переполнении перезаписываются самые старые значения.
+    Для каждого запрошенного интервала поддерживается WindowExtremes.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity: int = capacity
+        self._timestamps = array('d', bytes(8 * capacity))
+        self._prices = array('d', bytes(8 * capacity))
+        self._start: int = 0
+        self._size: int = 0
+        self._extremes: Dict[int, WindowExtremes] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, timestamp: float, price: float) -> None:
+        """
+        Добавляет новое значение цены
+
+        Значения не новее последнего игнорируются.
+
+        Args:
+            timestamp: Время получения цены
+            price: Цена
+
+        Returns:
+            None
+        """
+        if self._size and timestamp <= self._timestamps[(self._start + self._size - 1) % self.capacity]:
+            return
+        if self._size == self.capacity:
+            position = self._start
+            self._start = (self._start + 1) % self.capacity
+        else:
+            position = (self._start + self._size) % self.capacity
+            self._size += 1
+        self._timestamps[position] = timestamp
+        self._prices[position] = price
+        for extremes in self._extremes.values():
+            extremes.push(timestamp, price)
+
+    def last(self) -> Optional[Sample]:
+        """
+        Получает последнее значение цены
+
+        Returns:
+            Кортеж (timestamp, price) или None, если буфер пуст
+        """
+        if not self._size:
+            return None
+        position = (self._start + self._size - 1) % self.capacity
+        return self._timestamps[position], self._prices[position]
+
+    def samples(self) -> Iterator[Sample]:
+        """
+        Перебирает значения от самого старого к самому новому
+
+        Returns:
+            Итератор по кортежам (timestamp, price)
+        """
+        for offset in range(self._size):
+            position = (self._start + offset) % self.capacity
+            yield self._timestamps[position], self._prices[position]
+
+    def extremes(self, interval: int, now: float) -> Tuple[Optional[Sample], Optional[Sample]]:
+        """
+        Получает минимум и максимум цены за интервал
+
+        При первом запросе интервала очереди заполняются из буфера,
+        дальше поддерживаются при каждом добавлении цены.
+
+        Args:
+            interval: Длина интервала в секундах
+            now: Текущее время
+
+        Returns:
+            Кортеж ((timestamp, min_price), (timestamp, max_price))
+        """
+        extremes = self._extremes.get(interval)
+        if extremes is None:
+            extremes = WindowExtremes(interval)
+            for timestamp, price in self.samples():
+                if timestamp >= now - interval:
+                    extremes.push(timestamp, price)
+            self._extremes[interval] = extremes
+        extremes.evict(now)
+        return extremes.min(), extremes.max()
+
+    def deviation(self, interval: int, now: float, current_price: float) -> Optional[Tuple[float, float]]:
+        """
+        Находит наибольшее отклонение текущей цены от цен за интервал
+
+        Args:
+            interval: Длина интервала в секундах
+            now: Текущее время
+            current_price: Текущая цена
+
+        Returns:
+            Кортеж (отклонение в долях, timestamp опорной цены) или None,
+            если за интервал нет данных
+        """
+        low, high = self.extremes(interval, now)
+        if low is None or high is None:
+            return None
+        rise = (current_price - low[1]) / low[1] if low[1] else 0.0
+        fall = (current_price - high[1]) / high[1] if high[1] else 0.0
+        if abs(rise) >= abs(fall):
+            return rise, low[0]
+        return fall, high[0]
+
+
+class PriceWindows:
+    """
+    Набор скользящих окон цен по всем тикерам
+    """
+
+    def __init__(self, span: int = 86400, step: int = 60) -> None:
+        self.span: int = span
+        # запас на неровный шаг планировщика
+        self.capacity: int = span // step + span // step // 10 + 1
+        self._windows: Dict[str, PriceWindow] = {}
+
+    def add(self, ticker: str, timestamp: float, price: float) -> None:
+        """
+        Добавляет цену в окно тикера
+
+        Returns:
+            None
+        """
+        window = self._windows.get(ticker)
+        if window is None:
+            window = self._windows[ticker] = PriceWindow(self.capacity)
+        window.append(timestamp, price)
+
+    def get(self, ticker: str) -> Optional[PriceWindow]:
+        """
+        Получает окно цен тикера
+
+        Returns:
+            PriceWindow или None, если по тикеру ещё нет цен
+        """
+        return self._windows.get(ticker)
+
+    def extend(self, ticker: str, timestamps: Iterable[float], prices: Iterable[float]) -> None:
+        """
+        Добавляет в окно тикера ряд цен, заданный колонками
+
+        Args:
+            ticker: Тикер криптовалюты
+            timestamps: Времена по возрастанию
+            prices: Цены
+
+        Returns:
+            None
+        """
+        window = self._windows.get(ticker)
+        if window is None:
+            window = self._windows[ticker] = PriceWindow(self.capacity)
+        for timestamp, price in zip(timestamps, prices):
+            window.append(timestamp, float(price))
+
+    def warm(self, rows: Iterable[Tuple[str, float, int]]) -> None:
+        """
+        Заполняет окна историей цен из базы данных
+
+        Args:
+            rows: Записи [(ticker, price, timestamp), ...] по возрастанию времени
+
+        Returns:
+            None
+        """
+        count = 0
+        for ticker, price, timestamp in rows:
+            self.add(ticker, timestamp, price)
+            count += 1
+        logger.info(f'Price windows warmed with {count} samples for {len(self._windows)} tickers')
+
+
+price_windows = PriceWindows()
@@ -0,0 +1,58 @@
+"""
+Ограничение частоты запросов к внешним API
+"""
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Асинхронный token bucket
+
+    Пополняется со скоростью rate токенов в секунду до capacity.
+    acquire() ждёт, пока не появится свободный токен.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate: float = rate
+        self.capacity: float = capacity
+        self._tokens: float = capacity
+        self._updated: float = time.monotonic()
+        self._paused_until: float = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """
+        Забирает один токен, при необходимости дожидаясь его
+
+        Returns:
+            None
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Приостанавливает выдачу токенов, например после ответа 429 от API
+
+        Args:
+            seconds: На сколько секунд приостановить выдачу
+
+        Returns:
+            None
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
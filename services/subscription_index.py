@@ -0,0 +1,190 @@
+"""
+In-memory индекс подписок пользователей по тикерам
+"""
+import logging
+from typing import Dict, List, Tuple, Iterable
+
+logger = logging.getLogger(__name__)
+
+# (user_id, last_alert, alert_threshold, interval)
+Subscriber = Tuple[int, float, int, int]
+# (alert_threshold, interval)
+BucketKey = Tuple[int, int]
+
+
+class SubscriptionIndex:
+    """
+    Индекс подписок, сгруппированных по тикерам
+
+    Загружается из базы одним запросом и дальше поддерживается в актуальном
+    состоянии точечными изменениями из функций database.py, поэтому
+    планировщику не нужно перечитывать таблицу подписок на каждом тике.
+    Пока индекс не загружен, изменения игнорируются. Изменения из других
+    процессов обнаруживаются по счётчику version (см. get_change_version).
+
+    Внутри тикера подписчики разложены по корзинам (alert_threshold, interval),
+    чтобы проверять порог один раз на корзину, а не на каждого пользователя.
+    """
+
+    def __init__(self) -> None:
+        self._buckets: Dict[str, Dict[BucketKey, Dict[int, float]]] = {}
+        self._settings: Dict[str, Dict[int, BucketKey]] = {}
+        self.loaded: bool = False
+        self.version: int = -1
+
+    def load(self, subscriptions: Dict[str, List[Subscriber]], version: int = -1) -> None:
+        """
+        Полностью заменяет содержимое индекса
+
+        Время последнего уведомления, уже известное индексу, не откатывается
+        назад: в памяти оно может быть новее, чем в базе, пока отметки
+        не записаны из alert_ledger.
+
+        Args:
+            subscriptions: Словарь {ticker: [(user_id, last_alert, alert_threshold, interval), ...]}
+            version: Значение счётчика изменений подписок, соответствующее данным
+
+        Returns:
+            None
+        """
+        known = {
+            (ticker, user_id): last_alert
+            for ticker, buckets in self._buckets.items()
+            for users in buckets.values()
+            for user_id, last_alert in users.items()
+        }
+        self._buckets = {}
+        self._settings = {}
+        self.loaded = True
+        self.version = version
+        for ticker, subs in subscriptions.items():
+            for user_id, last_alert, threshold, interval in subs:
+                last_alert = max(last_alert, known.get((ticker, user_id), last_alert))
+                self.add(user_id, ticker, last_alert, threshold, interval)
+        logger.debug(f'Subscription index loaded: {len(self._buckets)} tickers, version {version}')
+
+    def advance(self, version: int, changes: int) -> None:
+        """
+        Учитывает изменения подписок, сделанные этим процессом
+
+        Индекс уже исправлен точечно, поэтому, если до этих изменений он
+        соответствовал счётчику, он соответствует и новому значению и не будет
+        перезагружен. Если счётчик успели увеличить другие процессы,
+        индекс остаётся устаревшим и загрузится заново.
+
+        Args:
+            version: Значение счётчика после изменений, прочитанное в той же транзакции
+            changes: Сколько строк подписок изменено (по одному срабатыванию триггера на строку)
+
+        Returns:
+            None
+        """
+        if self.loaded and self.version == version - changes:
+            self.version = version
+
+    def invalidate(self) -> None:
+        """
+        Сбрасывает индекс, следующий тик загрузит его заново
+
+        Returns:
+            None
+        """
+        self._buckets = {}
+        self._settings = {}
+        self.loaded = False
+        self.version = -1
+
+    def get(self, ticker: str) -> List[Subscriber]:
+        """
+        Получает подписчиков тикера
+
+        Args:
+            ticker: Тикер криптовалюты
+
+        Returns:
+            Список кортежей [(user_id, last_alert, alert_threshold, interval), ...]
+        """
+        return [
+            (user_id, last_alert, threshold, interval)
+            for (threshold, interval), users in self._buckets.get(ticker, {}).items()
+            for user_id, last_alert in users.items()
+        ]
+
+    def buckets(self, ticker: str) -> Dict[BucketKey, Dict[int, float]]:
+        """
+        Получает подписчиков тикера, сгруппированных по настройкам
+
+        Args:
+            ticker: Тикер криптовалюты
+
+        Returns:
+            Словарь {(alert_threshold, interval): {user_id: last_alert}}
+        """
+        return self._buckets.get(ticker, {})
+
+    def tickers(self) -> Iterable[str]:
+        """
+        Получает тикеры, на которые есть хотя бы одна подписка
+
+        Returns:
+            Итератор по тикерам
+        """
+        return iter(self._buckets)
+
+    def add(self, user_id: int, ticker: str, last_alert: float, threshold: int, interval: int) -> None:
+        """
+        Добавляет подписку в индекс
+
+        Returns:
+            None
+        """
+        if not self.loaded:
+            return
+        self.remove(user_id, ticker)
+        key = (threshold, interval)
+        self._buckets.setdefault(ticker, {}).setdefault(key, {})[user_id] = last_alert
+        self._settings.setdefault(ticker, {})[user_id] = key
+
+    def update_settings(self, user_id: int, ticker: str, threshold: int, interval: int) -> None:
+        """
+        Обновляет порог и интервал подписки
+
+        Returns:
+            None
+        """
+        key = self._settings.get(ticker, {}).get(user_id)
+        if key is not None:
+            last_alert = self._buckets[ticker][key][user_id]
+            self.add(user_id, ticker, last_alert, threshold, interval)
+
+    def set_last_alert(self, user_id: int, ticker: str, last_alert: float) -> None:
+        """
+        Обновляет время последнего уведомления
+
+        Returns:
+            None
+        """
+        key = self._settings.get(ticker, {}).get(user_id)
+        if key is not None:
+            self._buckets[ticker][key][user_id] = last_alert
+
+    def remove(self, user_id: int, ticker: str) -> None:
+        """
+        Удаляет подписку из индекса
+
+        Returns:
+            None
+        """
+        key = self._settings.get(ticker, {}).pop(user_id, None)
+        if key is None:
+            return
+        buckets = self._buckets[ticker]
+        del buckets[key][user_id]
+        if not buckets[key]:
+            del buckets[key]
+        if not buckets:
+            del self._buckets[ticker]
+            del self._settings[ticker]
+
+
+subscription_index = SubscriptionIndex()
@@ -0,0 +1,4 @@
+import os
+
+# config читает обязательные переменные окружения при импорте
+os.environ.setdefault('TIME_ZONE', '0')
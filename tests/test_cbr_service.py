@@ -0,0 +1,88 @@
+"""
+Запросы к ЦБ РФ не должны блокировать цикл событий
+"""
+import asyncio
+import time
+from typing import Dict, Tuple
+
+import pytest
+
+from config.config import config
+from services import cbr_service
+from services.cbr_service import CBRRateStore
+
+# сколько отвечает медленная заглушка ЦБ, секунды
+CBR_DELAY = 0.5
+# допустимая задержка цикла событий, секунды
+MAX_LAG = 0.1
+HEARTBEAT = 0.01
+
+
+def slow_fetch_rates_on_date(on_date) -> Dict[str, float]:
+    time.sleep(CBR_DELAY)
+    return {'USD': 90.0 + on_date.day, 'EUR': 100.0}
+
+
+async def refresh_with_heartbeat(store: CBRRateStore) -> Tuple[float, float]:
+    """
+    Обновляет курсы, одновременно измеряя наибольшую задержку цикла событий
+
+    Returns:
+        Кортеж (наибольшая задержка, длительность обновления)
+    """
+    lag = 0.0
+    done = asyncio.Event()
+
+    async def heartbeat() -> None:
+        nonlocal lag
+        while not done.is_set():
+            started = time.monotonic()
+            await asyncio.sleep(HEARTBEAT)
+            lag = max(lag, time.monotonic() - started - HEARTBEAT)
+
+    task = asyncio.create_task(heartbeat())
+    # пульс должен начать отсчёт раньше, чем обновление займёт цикл
+    await asyncio.sleep(0)
+    started = time.monotonic()
+    try:
+        await store.refresh()
+    finally:
+        done.set()
+        await task
+    return lag, time.monotonic() - started
+
+
+@pytest.fixture
+def slow_cbr(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(cbr_service, 'fetch_rates_on_date', slow_fetch_rates_on_date)
+
+
+def test_refresh_does_not_block_event_loop(slow_cbr: None) -> None:
+    store = CBRRateStore(['usd', 'eur'])
+    lag, elapsed = asyncio.run(refresh_with_heartbeat(store))
+    # даты запрашиваются по очереди в одном потоке
+    assert elapsed >= 2 * CBR_DELAY
+    assert lag < MAX_LAG
+    assert len(store.services['USD']) == 2
+
+
+def test_refresh_timeout_keeps_previous_rates(slow_cbr: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(config, 'CBR_TIMEOUT', CBR_DELAY / 5)
+    store = CBRRateStore(['usd'])
+    lag, elapsed = asyncio.run(refresh_with_heartbeat(store))
+    assert elapsed < CBR_DELAY
+    assert lag < MAX_LAG
+    assert len(store.services['USD']) == 0
+    assert not asyncio.run(store.is_fresh())
+
+
+def test_refresh_error_keeps_previous_rates(monkeypatch: pytest.MonkeyPatch) -> None:
+    def failing_fetch_rates_on_date(on_date) -> Dict[str, float]:
+        raise ConnectionError('CBR is unavailable')
+
+    store = CBRRateStore(['usd'])
+    monkeypatch.setattr(cbr_service, 'fetch_rates_on_date', slow_fetch_rates_on_date)
+    asyncio.run(store.refresh())
+    monkeypatch.setattr(cbr_service, 'fetch_rates_on_date', failing_fetch_rates_on_date)
+    asyncio.run(store.refresh())
+    assert len(store.services['USD']) == 2
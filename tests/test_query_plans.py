@@ -0,0 +1,137 @@
+"""
+Регрессионная проверка планов горячих запросов: ни один не должен читать таблицу целиком
+
+Запросы не переписываются в тест, а перехватываются через set_trace_callback,
+пока настоящие функции database.py работают с временной базой. Затем для
+каждого перехваченного запроса строится EXPLAIN QUERY PLAN.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List
+
+import pytest
+
+import database
+from migrations import migrate
+
+NOW = int(time.time())
+
+# горячие пути: обработчики команд пользователей, ежеминутный сбор цен
+# и рассылка уведомлений, ежечасная очистка истории
+HOT_CALLS: List[Callable[[], Awaitable]] = [
+    lambda: database.add_user(1),
+    lambda: database.get_user(1),
+    lambda: database.add_coin('bitcoin'),
+    lambda: database.add_subscription(1, 'bitcoin', 5, 3600),
+    lambda: database.get_user_subscriptions(1),
+    lambda: database.get_user_subscriptions_by_ticker('bitcoin'),
+    lambda: database.get_user_subscriptions_settings(1, 'bitcoin'),
+    lambda: database.update_user_subscription(1, 'bitcoin', 3, 600),
+    lambda: database.update_last_alert(1, 'bitcoin'),
+    lambda: database.update_last_alerts([(NOW, 1, 'bitcoin')]),
+    lambda: database.get_coin_from_list('bitcoin'),
+    lambda: database.check_cbrf_subscription(1),
+    lambda: database.cbrf_subscribe(1, True),
+    lambda: database.get_cbrf_users(),
+    lambda: database.add_prices([('bitcoin', 50000.0, NOW - 60), ('ethereum', 3000.0, NOW - 60)]),
+    lambda: database.add_prices([('bitcoin', 50100.0, NOW), ('ethereum', 3010.0, NOW)]),
+    lambda: database.get_last_prices_for_ticker('bitcoin', 3600),
+    lambda: database.get_prices_since(3600),
+    lambda: database.get_latest_prices(['bitcoin', 'ethereum'], NOW - 120),
+    lambda: database.get_price_stats(['bitcoin', 'ethereum'], 3600),
+    lambda: database.get_price_stats(['bitcoin', 'ethereum'], 7 * 86400),
+    lambda: database.delete_old_prices(database.RAW_PRICES_RETENTION),
+    lambda: database.delete_old_rollups(),
+    lambda: database.get_change_version('subscriptions'),
+    lambda: database.try_acquire_lock('scheduler', 'test', 60),
+    lambda: database.release_lock('scheduler', 'test'),
+    lambda: database.delete_user_subscription(1, 'bitcoin'),
+    lambda: database.delete_coins('bitcoin'),
+]
+
+# запросы к схеме (список дневных таблиц цен) читают sqlite_master целиком
+# и не считаются
+IGNORED = ('sqlite_master', )
+
+
+def full_scans(plan: List[str]) -> List[str]:
+    """
+    Выбирает шаги плана, которые читают таблицу целиком
+
+    Перебор списка значений из VALUES и материализованных подзапросов
+    полным чтением не считается.
+    """
+    materialized = {detail.split()[-1] for detail in plan if detail.startswith('MATERIALIZE')}
+    return [
+        detail for detail in plan
+        if detail.startswith('SCAN') and 'CONSTANT ROW' not in detail and detail.split()[1] not in materialized
+    ]
+
+
+async def explain(db, sql: str) -> List[str]:
+    cursor = await db.execute(f"EXPLAIN QUERY PLAN {sql}")
+    return [row[3] for row in await cursor.fetchall()]
+
+
+async def capture_hot_queries(db_file: str) -> Dict[str, List[str]]:
+    """
+    Выполняет горячие функции database.py и строит планы всех их запросов
+
+    Returns:
+        Словарь {запрос: шаги плана}
+    """
+    pool = database.db_pool
+    statements: List[str] = []
+    await pool.open()
+    try:
+        async with pool.writer() as db:
+            await migrate(db)
+            await db.commit()
+        for conn in [pool._writer, *pool._readers]:
+            await conn.set_trace_callback(statements.append)
+        for call in HOT_CALLS:
+            await call()
+        for conn in [pool._writer, *pool._readers]:
+            await conn.set_trace_callback(None)
+        plans: Dict[str, List[str]] = {}
+        async with pool.reader() as db:
+            for sql in dict.fromkeys(statements):
+                if sql.split(None, 1)[0].upper() not in ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE'):
+                    continue
+                if any(name in sql for name in IGNORED):
+                    continue
+                plans[sql] = await explain(db, sql)
+        return plans
+    finally:
+        await pool.close()
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch: pytest.MonkeyPatch) -> str:
+    db_file = str(tmp_path / 'db.sqlite')
+    monkeypatch.setattr(database, 'db_pool', database.ConnectionPool(db_file))
+    monkeypatch.setattr(database, 'PRICE_PARTITIONS', set())
+    return db_file
+
+
+def test_hot_queries_use_indexes(temp_db: str) -> None:
+    plans = asyncio.run(capture_hot_queries(temp_db))
+    # без перехваченных запросов к ценам и подпискам проверка ничего не значит
+    assert any('prices_p' in sql for sql in plans)
+    assert any('price_blocks' in sql for sql in plans)
+    assert any('subscriptions' in sql for sql in plans)
+    scans = {sql: full_scans(plan) for sql, plan in plans.items() if full_scans(plan)}
+    assert not scans, '\n\n'.join(f'{sql}\n  -> {steps}' for sql, steps in scans.items())
+
+
+def test_full_scan_detected(temp_db: str) -> None:
+    async def plan() -> List[str]:
+        try:
+            async with database.db_pool.writer() as db:
+                await migrate(db)
+                await db.commit()
+                return await explain(db, "SELECT * FROM subscriptions WHERE last_alert > 0")
+        finally:
+            await database.db_pool.close()
+
+    assert full_scans(asyncio.run(plan()))
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import Bot, Dispatcher, BaseMiddleware
+from aiogram.types import TelegramObject
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    """
+    Ограничивает число одновременно обрабатываемых обновлений
+
+    В режиме webhook каждое обновление обрабатывается в отдельной задаче,
+    поэтому без ограничения всплеск запросов от Telegram запускает
+    неограниченное число обработчиков одновременно.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with self._semaphore:
+            return await handler(event, data)
+
+
+def require_webhook_secret() -> None:
+    """
+    Проверяет, что для режима webhook задан WEBHOOK_SECRET
+
+    Без секрета сервер принимал бы обновления от кого угодно, поэтому
+    режим webhook без него не запускается.
+
+    Raises:
+        ValueError: Если WEBHOOK_SECRET не задан
+    """
+    if not config.WEBHOOK_SECRET:
+        raise ValueError(f'WEBHOOK_SECRET must be set when BOT_MODE=webhook')
+
+
+def build_webhook_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    """
+    Создаёт aiohttp-приложение, принимающее обновления от Telegram
+
+    Запросы без правильного заголовка X-Telegram-Bot-Api-Secret-Token
+    (WEBHOOK_SECRET) отклоняются. Приложение можно проверить
+    локально, отправляя POST-запросы с записанными обновлениями
+    на WEBHOOK_PATH.
+
+    Args:
+        dp: Диспетчер с подключенными роутерами
+        bot: Экземпляр Telegram бота
+
+    Returns:
+        web.Application: Приложение с обработчиком обновлений
+
+    Raises:
+        ValueError: Если WEBHOOK_SECRET не задан
+    """
+    require_webhook_secret()
+    dp.update.outer_middleware(ConcurrencyLimitMiddleware(config.WEBHOOK_CONCURRENCY))
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=config.WEBHOOK_SECRET,
+    ).register(app, path=config.WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """
+    Регистрирует webhook в Telegram и запускает веб-сервер для приёма обновлений
+
+    Работает до отмены задачи, после чего останавливает сервер.
+
+    Args:
+        dp: Диспетчер с подключенными роутерами
+        bot: Экземпляр Telegram бота
+
+    Returns:
+        None
+    """
+    app = build_webhook_app(dp, bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=config.WEBAPP_HOST, port=config.WEBAPP_PORT)
+    await site.start()
+    await bot.set_webhook(
+        f'{config.WEBHOOK_URL}{config.WEBHOOK_PATH}',
+        secret_token=config.WEBHOOK_SECRET,
+        max_connections=min(config.WEBHOOK_CONCURRENCY, 100),
+    )
+    logger.info(f'Webhook server listening on {config.WEBAPP_HOST}:{config.WEBAPP_PORT}{config.WEBHOOK_PATH}')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await bot.session.close()